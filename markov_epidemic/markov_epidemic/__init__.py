@@ -3,3 +3,7 @@ from .seir_epidemic import *
 from .sir_epidemic import *
 from .sis_epidemic import *
 from .utils import *
+from .parallel import *
+from .spectral_cache import *
+from .sweep import *
+from .threshold import *
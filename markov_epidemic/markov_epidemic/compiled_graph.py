@@ -0,0 +1,62 @@
+import numpy as np
+import networkx as nx
+
+
+class CompiledGraph:
+    """One-time compilation of a networkx graph into contiguous CSR arrays
+    (indptr, indices as int32, and edge weights), plus the mapping between
+    node labels and their indices 0, ..., N-1.
+    in_indptr, in_indices and in_weights are the CSR arrays of the
+    transposed adjacency matrix, i.e its columns: column i lists the nodes
+    whose number of infected neighbors depends on node i. For undirected
+    graphs they are the same arrays as the rows.
+    Simulations only work on indices and these arrays, labels are only
+    used to translate inputs and outputs.
+    """
+    def __init__(self, G: nx.Graph) -> None:
+        self.labels = list(G.nodes)
+        self.index = {label: i for i, label in enumerate(self.labels)}
+
+        A = nx.adjacency_matrix(G, nodelist=self.labels).tocsr()
+        A.sort_indices()
+        self.indptr = A.indptr.astype('int32')
+        self.indices = A.indices.astype('int32')
+        self.weights = A.data.astype('float')
+
+        if G.is_directed():
+            A_in = A.T.tocsr()
+            A_in.sort_indices()
+            self.in_indptr = A_in.indptr.astype('int32')
+            self.in_indices = A_in.indices.astype('int32')
+            self.in_weights = A_in.data.astype('float')
+        else:
+            self.in_indptr = self.indptr
+            self.in_indices = self.indices
+            self.in_weights = self.weights
+
+    @property
+    def N(self) -> int:
+        return len(self.labels)
+
+    def neighbors(self, i: int) -> tuple:
+        """Returns the indices of the neighbors of node i and the weights
+        of the corresponding edges.
+        """
+        start, end = self.indptr[i], self.indptr[i+1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def in_neighbors(self, i: int) -> tuple:
+        """Returns the indices of the nodes j with an edge j -> i (the
+        nodes whose number of infected neighbors counts node i) and the
+        weights of the corresponding edges.
+        """
+        start, end = self.in_indptr[i], self.in_indptr[i+1]
+        return self.in_indices[start:end], self.in_weights[start:end]
+
+    def to_indices(self, labels) -> np.ndarray:
+        return np.array([self.index[label] for label in labels],
+                        dtype='int64',
+                        )
+
+    def to_labels(self, indices: np.ndarray) -> list:
+        return [self.labels[i] for i in indices]
@@ -0,0 +1,28 @@
+class graph_invariant:
+    """Read-only property for quantities that only depend on the graph G
+    of an epidemic (adjacency matrix, spectrum...).
+    The value is computed on first access and cached on the instance
+    itself, stamped with the version of the graph it was computed from:
+    the cache is released together with the instance, and reassigning G
+    (which bumps the version) only invalidates the entries of that
+    instance.
+    """
+    def __init__(self, fget) -> None:
+        self.fget = fget
+        self.name = fget.__name__
+        self.__doc__ = fget.__doc__
+
+    def __set_name__(self, owner, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cache = instance._graph_cache
+        version = instance._graph_version
+        entry = cache.get(self.name)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        value = self.fget(instance)
+        cache[self.name] = (version, value)
+        return value
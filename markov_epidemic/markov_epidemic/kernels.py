@@ -0,0 +1,95 @@
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit when numba is not installed: functions
+        are left uncompiled (and callers should prefer the NumPy engine).
+        """
+        def decorator(f):
+            return f
+        return decorator
+
+
+@njit(cache=True)
+def _set_rate(j, x, num_infected_neighbors, tree, size,
+              spontaneous_rates, contact_rates):
+    """Recompute the rate of node j and propagate it up the sum tree.
+    """
+    position = size + j
+    tree[position] = spontaneous_rates[x[j]] \
+        + contact_rates[x[j]] * num_infected_neighbors[j]
+    position //= 2
+    while position >= 1:
+        tree[position] = tree[2*position] + tree[2*position+1]
+        position //= 2
+
+
+@njit(cache=True)
+def gillespie_kernel(t, T,
+                     in_indptr, in_indices, in_weights,
+                     x, num_infected_neighbors, tree, size, counts,
+                     spontaneous_rates, contact_rates, next_state_table,
+                     infected, active_states,
+                     exponentials, uniforms,
+                     out_times, out_nodes, out_old_states, out_new_states,
+                     ):
+    """Compiled event loop of the direct method over the CSR arrays of the
+    transposed adjacency matrix of the graph (see CompiledGraph), with
+    node rates stored in a sum tree (see SumTree).
+    x, num_infected_neighbors, tree and counts are updated in place.
+    Runs until time T, extinction (no node left in an active state), or
+    until either the random numbers or the output buffers are exhausted.
+    Returns the current time and the number of recorded transitions.
+    """
+    n_events = 0
+    n_max = min(len(out_times), len(uniforms))
+    while t < T and n_events < n_max:
+        n_active = 0
+        for state in range(len(counts)):
+            if active_states[state]:
+                n_active += counts[state]
+        if n_active == 0:
+            break
+
+        total_rate = tree[1]
+        u = uniforms[n_events] * total_rate
+        position = 1
+        while position < size:
+            left = tree[2*position]
+            if u < left or tree[2*position+1] <= 0:
+                position = 2 * position
+            else:
+                u -= left
+                position = 2 * position + 1
+        i = position - size
+        t += exponentials[n_events] / total_rate
+
+        old_state = x[i]
+        new_state = next_state_table[old_state]
+        x[i] = new_state
+        counts[old_state] -= 1
+        counts[new_state] += 1
+
+        out_times[n_events] = t
+        out_nodes[n_events] = i
+        out_old_states[n_events] = old_state
+        out_new_states[n_events] = new_state
+        n_events += 1
+
+        _set_rate(i, x, num_infected_neighbors, tree, size,
+                  spontaneous_rates, contact_rates)
+        delta = int(new_state == infected) - int(old_state == infected)
+        if delta != 0:
+            for k in range(in_indptr[i], in_indptr[i+1]):
+                j = in_indices[k]
+                num_infected_neighbors[j] += delta * in_weights[k]
+                # No negative counts left by rounding errors
+                if num_infected_neighbors[j] < 0.0:
+                    num_infected_neighbors[j] = 0.0
+                _set_rate(j, x, num_infected_neighbors, tree, size,
+                          spontaneous_rates, contact_rates)
+
+    return t, n_events
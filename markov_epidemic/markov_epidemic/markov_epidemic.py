@@ -1,23 +1,62 @@
 import abc
 import numpy as np
 import scipy
+import scipy.integrate
+import scipy.sparse.linalg
 import networkx as nx
-from functools import lru_cache
-from copy import copy
+from .graph_cache import graph_invariant
+from .compiled_graph import CompiledGraph
+from .spectral_cache import graph_fingerprint
+from .rate_engine import RateEngine
+from .sum_tree import SumTree
+from .priority_queue import IndexedPriorityQueue
+from .trajectory import EventLog, GridRecorder
+from .memmap_log import MemmapEventLog
+from .results import save_result, load_result
+from .random_buffer import RandomBuffer
+from .kernels import NUMBA_AVAILABLE, gillespie_kernel
 
 
 class MarkovEpidemic(abc.ABC):
     """Generic class to simulate Markov epidemics.
     """
+    # Node states are small integers (at most 4 states in SEIR), stored
+    # as bytes in state vectors and trajectories.
+    state_dtype = np.uint8
+
     def __init__(self,
                  G: nx.Graph,
                  simulation_method: str = 'fastest',
+                 rng=None,
                  ) -> None:
+        # Per-instance cache of graph invariants, see graph_invariant.
+        self._graph_cache = {}
+        self._graph_version = 0
+
         self._G = G
         self._simulation_method = simulation_method
 
-        self.X = np.empty(0)
-        self.transition_times = np.empty(0)
+        # Accepts a numpy Generator, or anything np.random.default_rng
+        # accepts as a seed.
+        self.rng = np.random.default_rng(rng)
+
+        # Error control of the tau_leap simulation method: bound on the
+        # relative change of the transition rates during a leap.
+        self.tau_leap_epsilon = 0.03
+
+        # Optional warm-start vector for the sparse eigensolver (by default,
+        # the leading eigenvector of the previous graph of the same size).
+        self.spectral_v0 = None
+        self._previous_leading_eigenvector = None
+
+        # Optional persistent SpectralCache, consulted before any eigen
+        # computation.
+        self.spectral_cache = None
+
+        # Horizon and initial random state of the last simulation.
+        self.T = None
+        self.rng_state = None
+        self.trajectory = None
         self.nodes_infected_at_least_once = set()
 
     @property
@@ -32,6 +71,14 @@ class MarkovEpidemic(abc.ABC):
         """
         return 1
 
+    @property
+    @abc.abstractmethod
+    def number_of_states(self) -> int:
+        """To be implemented in a child class.
+        States are encoded as integers 0, ..., number_of_states - 1.
+        """
+        pass
+
     @property
     def G(self) -> nx.Graph:
         return self._G
@@ -53,58 +100,126 @@ class MarkovEpidemic(abc.ABC):
     def N(self) -> int:
         return self.G.number_of_nodes()
 
+    @graph_invariant
+    def graph(self) -> CompiledGraph:
+        """G compiled to CSR arrays. Node i in state vectors, rates and
+        event logs is the node labelled nodes_list[i] in G.
+        """
+        return CompiledGraph(self.G)
+
     @property
-    @lru_cache(maxsize=None)
     def nodes_list(self) -> list:
-        return list(self.G.nodes)
+        return self.graph.labels
+
+    def state_vector(self, states: dict) -> np.ndarray:
+        """Returns the state vector x0 (indexed like nodes_list) in which
+        node labelled label is in state states[label], and all other nodes
+        are susceptible.
+        """
+        x0 = np.full(self.N, self.susceptible, dtype=self.state_dtype)
+        x0[self.graph.to_indices(states.keys())] = list(states.values())
+        return x0
 
     def random_seed_nodes(self, k):
         """Select k nodes uniformly at random to be infectedself.
         Returns a vector x0 such that x0[i] = 1 if i is in the seed group,
         0 otherwise.
         """
-        x0 = np.zeros(self.N)
-        seed_patients = np.random.choice(self.G.nodes, size=k, replace=False)
+        x0 = np.zeros(self.N, dtype=self.state_dtype)
+        seed_patients = self.rng.choice(self.N, size=k, replace=False)
         x0[seed_patients] = self.infected
         return x0
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
     def A(self) -> scipy.sparse.csr.csr_matrix:
-        """Adjacency matrix of G.
+        """Adjacency matrix of G, sharing its arrays with self.graph.
         """
-        return nx.adjacency_matrix(self.G)
+        return scipy.sparse.csr_matrix(
+            (self.graph.weights, self.graph.indices, self.graph.indptr),
+            shape=(self.N, self.N),
+            )
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
+    def fingerprint(self) -> str:
+        """Canonical hash of the adjacency matrix of G.
+        """
+        return graph_fingerprint(self.A)
+
+    def cached_spectral_invariant(self, name: str, calculate) -> np.ndarray:
+        """Look up a spectral invariant in the persistent spectral cache
+        (if any) before calculating it, and store it there afterwards.
+        """
+        if self.spectral_cache is None:
+            return calculate()
+        value = self.spectral_cache.get(self.fingerprint).get(name)
+        if value is None:
+            value = calculate()
+            self.spectral_cache.put(self.fingerprint, **{name: value})
+        return value
+
+    @graph_invariant
     def spectrum(self) -> np.ndarray:
-        """Calculate and cache adjacency spectrum
+        """Calculate and cache the full adjacency spectrum
         (sorted in decreasing order).
+        This is a dense O(N^3) eigendecomposition, only computed when
+        explicitly requested: spectral_radius, spectral_gap and the
+        Cheeger bounds rely on extreme_eigenvalues instead.
         """
-        _spectrum = nx.adjacency_spectrum(self.G)
-        idx = _spectrum.argsort()[::-1]
-        return np.real(_spectrum[idx])
+        def calculate_spectrum():
+            _spectrum = nx.adjacency_spectrum(self.G)
+            idx = _spectrum.argsort()[::-1]
+            return np.real(_spectrum[idx])
+        return self.cached_spectral_invariant('spectrum', calculate_spectrum)
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
+    def extreme_eigenvalues(self) -> np.ndarray:
+        """Two largest adjacency eigenvalues (in decreasing order),
+        computed with a sparse Lanczos solver (ARPACK) on A, warm-started
+        from spectral_v0 if provided. A has non-negative weights, so the
+        largest one is the spectral radius (Perron-Frobenius).
+        """
+        return self.cached_spectral_invariant(
+            'extreme_eigenvalues',
+            self._calculate_extreme_eigenvalues,
+            )
+
+    def _calculate_extreme_eigenvalues(self) -> np.ndarray:
+        if self.N <= 4 or self.G.is_directed():
+            # Too small for ARPACK, or not symmetric.
+            _spectrum = self.spectrum
+            return _spectrum[[0, min(1, self.N-1)]]
+
+        v0 = self.spectral_v0
+        if v0 is None and self._previous_leading_eigenvector is not None \
+                and len(self._previous_leading_eigenvector) == self.N:
+            v0 = self._previous_leading_eigenvector
+
+        eigenvalues, eigenvectors = scipy.sparse.linalg.eigsh(
+            self.A.astype('float'),
+            k=2,
+            which='LA',
+            v0=v0,
+            )
+        idx = eigenvalues.argsort()[::-1]
+        self._previous_leading_eigenvector = eigenvectors[:, idx[0]]
+        return eigenvalues[idx]
+
+    @graph_invariant
     def spectral_radius(self) -> float:
-        return np.max(np.abs(self.spectrum))
+        return self.extreme_eigenvalues[0]
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
     def spectral_gap(self) -> float:
-        return self.spectrum[0] - self.spectrum[1]
+        return self.extreme_eigenvalues[0] - self.extreme_eigenvalues[1]
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
     def cheeger_lower_bound(self) -> float:
         """Lower bound for the isoperimetric constant
         of the graph G given by its adjacency spectral gap.
         """
         return self.spectral_gap / 2
 
-    @property
-    @lru_cache(maxsize=None)
+    @graph_invariant
     def cheeger_upper_bound(self) -> float:
         """Upper bound for the isoperimetric constant
         of the graph G given by its adjacency spectral gap.
@@ -121,29 +236,114 @@ class MarkovEpidemic(abc.ABC):
         return 0.5 * (self.cheeger_lower_bound + self.cheeger_upper_bound)
 
     def flush_graph(self) -> None:
-        """Clear LRU cache of graph related properties.
+        """Invalidate and release the cached graph related properties
+        of this instance (other instances are not affected).
+        """
+        self._graph_version += 1
+        self._graph_cache.clear()
+
+    @property
+    def transition_times(self) -> np.ndarray:
+        """Transition times of the simulated epidemic
+        (starting with the initial time 0).
+        """
+        if self.trajectory is None:
+            return np.empty(0)
+        return self.trajectory.transition_times
+
+    @property
+    def transition_nodes(self) -> list:
+        """Labels (in G) of the node that transitioned at each transition
+        time of the simulated epidemic (excluding the initial time 0).
         """
-        type(self).nodes_list.fget.cache_clear()
-        type(self).A.fget.cache_clear()
-        type(self).spectrum.fget.cache_clear()
-        type(self).spectral_radius.fget.cache_clear()
-        type(self).spectral_gap.fget.cache_clear()
-        type(self).cheeger_lower_bound.fget.cache_clear()
-        type(self).cheeger_upper_bound.fget.cache_clear()
+        if self.trajectory is None:
+            return []
+        return self.graph.to_labels(self.trajectory.nodes)
+
+    @property
+    def number_of_transitions(self) -> int:
+        """Number of transitions of the simulated epidemic.
+        """
+        if self.trajectory is None:
+            return 0
+        return len(self.trajectory)
+
+    @property
+    def X(self) -> np.ndarray:
+        """Full trajectory matrix, whose row k is the state vector after the
+        k-th transition (columns are indexed like nodes_list). It is rebuilt
+        from the event log on each access, which costs
+        O(N x number of transitions) memory.
+        """
+        if self.trajectory is None:
+            return np.empty(0)
+        return self.trajectory.to_dense()
+
+    @property
+    def X_packed(self) -> np.ndarray:
+        """Bit-packed trajectory matrix of a two-state model (e.g SIS),
+        row k is np.packbits of the state vector after the k-th transition,
+        i.e 8 times smaller than X.
+        """
+        if self.trajectory is None:
+            return np.empty(0, dtype='uint8')
+        return self.trajectory.to_dense(packed=True)
+
+    def number_in_state(self, state: int) -> np.ndarray:
+        """Returns the number of individuals in a given state at
+        each transition time of the simulated epidemic.
+        """
+        if self.trajectory is None:
+            return np.empty(0, dtype='int')
+        return self.trajectory.count(state)
 
     @property
     def number_of_susceptible(self) -> int:
         """Returns the number of susceptible individuals at
         each transition time of the simulated epidemic.
         """
-        return np.sum(self.X == self.susceptible, axis=1)
+        return self.number_in_state(self.susceptible)
 
     @property
     def number_of_infected(self) -> int:
         """Returns the number of infected individuals at
         each transition time of the simulated epidemic.
         """
-        return np.sum(self.X == self.infected, axis=1)
+        return self.number_in_state(self.infected)
+
+    def summary(self) -> dict:
+        """Summary statistics of the last simulation (recorded event by
+        event) over [0, T]: final_size is the number of nodes that were
+        not susceptible at some point, peak and peak_time the maximum
+        number of infected nodes and when it was first reached, lifetime
+        the extinction time (NaN if the epidemic was still going on at
+        the horizon T, extinct being False).
+        The exact simulation methods also record the first transition
+        after T, which is left out.
+        """
+        trajectory = self.trajectory
+        times = trajectory.transition_times
+        T = np.inf if self.T is None else self.T
+        # Number of recorded times (starting with 0) up to T
+        n = int(np.searchsorted(times, T, side='right'))
+        times = times[:n]
+        infected = trajectory.count(self.infected)[:n]
+        peak = int(np.argmax(infected))
+
+        left_susceptible = trajectory.nodes[:n-1][
+            trajectory.old_states[:n-1] == self.susceptible
+            ]
+        final_size = len(np.unique(left_susceptible)) \
+            + np.count_nonzero(trajectory.x0 != self.susceptible)
+
+        extinct = bool(self.is_over_given_counts(trajectory.counts[n-1]))
+        return {
+            'final_size': int(final_size),
+            'peak': int(infected[peak]),
+            'peak_time': float(times[peak]),
+            'lifetime': float(times[-1]) if extinct else np.nan,
+            'extinct': extinct,
+        }
 
     def number_infected_neighbors(self, Xt: np.ndarray) -> np.ndarray:
         """Returns the vector of number of infected neighbors given a
@@ -181,13 +381,165 @@ class MarkovEpidemic(abc.ABC):
     def deterministic_baseline_init(self, initial_infected: int) -> np.ndarray:
         raise NotImplementedError
 
-    @abc.abstractmethod
+    def _transition_matrix(self) -> np.ndarray:
+        """c[u, s] is the sign with which the flux out of state s enters
+        the derivative of the probability of state u: -1 if s == u, 1 if
+        s transitions to u.
+        """
+        c = -np.eye(self.number_of_states)
+        for state, next_state in enumerate(self.next_state_table):
+            if next_state != state:
+                c[next_state, state] = 1.0
+        return c
+
+    def _individual_based_probabilities(self, y: np.ndarray) -> np.ndarray:
+        """Probabilities P[s, i] of node i being in state s, from the
+        variables of the individual-based ODEs (all states but
+        susceptible, whose probability is 1 minus the others).
+        """
+        P = np.empty((self.number_of_states, self.N))
+        P[1:] = y.reshape(self.number_of_states - 1, self.N)
+        P[self.susceptible] = 1 - P[1:].sum(axis=0)
+        return P
+
+    def individual_based_ODEs(self, t: float, y: np.ndarray) -> np.ndarray:
+        """Individual-based (NIMFA) mean-field ODEs on the actual graph:
+        node i leaves state s at rate spontaneous_rates[s]
+        + contact_rates[s] * (A p)_i, where p is the vector of
+        probabilities of each node being infected.
+        y[(s-1)*N + i] is the probability of node i being in state s > 0.
+        """
+        P = self._individual_based_probabilities(y)
+        m = self.A.dot(P[self.infected])
+        flux = (self.spontaneous_rates[:, np.newaxis]
+                + self.contact_rates[:, np.newaxis] * m) * P
+        return self._transition_matrix()[1:].dot(flux).ravel()
+
+    def individual_based_jacobian(self,
+                                  t: float,
+                                  y: np.ndarray,
+                                  ) -> scipy.sparse.csr_matrix:
+        """Analytic sparse Jacobian of individual_based_ODEs: block (u, v)
+        is diagonal, plus a row-scaled copy of A in the column block of
+        the infected state, so nnz is O(number of states x (N + edges)).
+        """
+        P = self._individual_based_probabilities(y)
+        m = self.A.dot(P[self.infected])
+        d = self.spontaneous_rates[:, np.newaxis] \
+            + self.contact_rates[:, np.newaxis] * m
+        c = self._transition_matrix()
+        # Weights of the rows of A in the infected column blocks.
+        w = c.dot(self.contact_rates[:, np.newaxis] * P)
+
+        # The susceptible probability depends on all the variables (with
+        # coefficient -1), hence the d[susceptible] terms.
+        s0 = self.susceptible
+        blocks = []
+        for u in range(1, self.number_of_states):
+            row = []
+            for v in range(1, self.number_of_states):
+                block = scipy.sparse.diags(c[u, v] * d[v] - c[u, s0] * d[s0])
+                if v == self.infected:
+                    block = block + self.A.multiply(w[u][:, np.newaxis])
+                row.append(block)
+            blocks.append(row)
+        return scipy.sparse.bmat(blocks, format='csr')
+
+    def individual_based_baseline(self,
+                                  T: float,
+                                  x0: np.ndarray = np.empty(0),
+                                  initial_infected: int = 1,
+                                  n_t_eval: int = 100,
+                                  method: str = 'RK45',
+                                  node_probabilities: bool = False,
+                                  ) -> tuple:
+        """Solves the individual-based mean-field ODEs (see
+        individual_based_ODEs) on the actual graph, a deterministic
+        surrogate of the epidemic that accounts for its topology, unlike
+        deterministic_baseline.
+        Starts from the state vector x0, or if not given, from each node
+        being infected with probability initial_infected / N.
+        The ODEs are usually not stiff and explicit solvers (the default
+        RK45) are fastest. For stiff regimes (widely different rates),
+        method='BDF' or 'Radau' uses the analytic sparse Jacobian; their
+        sparse LU factorizations scale to large graphs with little
+        fill-in (e.g lattices), not to expanders (e.g random regular).
+        Returns the evaluation times and y, where y[s] is the expected
+        number of nodes in state s, and also P if node_probabilities,
+        where P[s, i] is the probability of node i being in state s.
+        """
+        if len(x0) == 0:
+            P0 = np.zeros((self.number_of_states, self.N))
+            P0[self.infected] = initial_infected / self.N
+        else:
+            P0 = np.zeros((self.number_of_states, self.N))
+            # Same conversion as in simulate, e.g for float state vectors
+            states = np.asarray(x0).astype(self.state_dtype)
+            P0[states, np.arange(self.N)] = 1.0
+
+        options = {}
+        if method in ('BDF', 'Radau'):
+            options['jac'] = self.individual_based_jacobian
+        solver = scipy.integrate.solve_ivp(
+            self.individual_based_ODEs,
+            (0.0, T),
+            P0[1:].ravel(),
+            method=method,
+            t_eval=np.linspace(0.0, T, n_t_eval),
+            **options,
+        )
+        assert solver.success, 'Integration of individual-based ODEs failed.'
+        P = np.stack([self._individual_based_probabilities(y)
+                      for y in solver.y.T], axis=-1)
+        if node_probabilities:
+            return solver.t, P.sum(axis=1), P
+        return solver.t, P.sum(axis=1)
+
     def transition_rates(self, Xt: np.ndarray) -> np.ndarray:
         """Markov transition rates, depends on the type of epidemic
         model (SIS, SIR, other...)
         """
+        return self.node_transition_rates(Xt,
+                                          self.number_infected_neighbors(Xt),
+                                          )
+
+    @property
+    @abc.abstractmethod
+    def parameters(self) -> dict:
+        """To be implemented in a child class.
+        Rates of the model by name, as saved with the results.
+        """
+        pass
+
+    @property
+    @abc.abstractmethod
+    def spontaneous_rates(self) -> np.ndarray:
+        """To be implemented in a child class.
+        spontaneous_rates[s] is the transition rate of a node in state s
+        that does not depend on its neighbors (e.g recovery).
+        """
+        pass
+
+    @property
+    @abc.abstractmethod
+    def contact_rates(self) -> np.ndarray:
+        """To be implemented in a child class.
+        contact_rates[s] is the transition rate of a node in state s
+        per infected neighbor (e.g infection of a susceptible node).
+        """
         pass
 
+    def node_transition_rates(self,
+                              x: np.ndarray,
+                              num_infected_neighbors: np.ndarray,
+                              ) -> np.ndarray:
+        """Returns the transition rates of nodes in states x with
+        num_infected_neighbors infected neighbors (both arrays have
+        the same length, which need not be N).
+        """
+        return self.spontaneous_rates[x] \
+            + self.contact_rates[x] * num_infected_neighbors
+
     @abc.abstractmethod
     def next_state(self, state: int) -> int:
         """To be implemented in a child class.
@@ -197,6 +549,21 @@ class MarkovEpidemic(abc.ABC):
         """
         pass
 
+    @property
+    def next_state_table(self) -> np.ndarray:
+        """Vectorized version of next_state: next_state_table[s] is the
+        state following s. Terminal states (from which next_state refuses
+        to move) are mapped to themselves, they never fire since their
+        transition rate is 0.
+        """
+        table = np.arange(self.number_of_states, dtype=self.state_dtype)
+        for state in range(self.number_of_states):
+            try:
+                table[state] = self.next_state(state)
+            except ValueError:
+                pass
+        return table
+
     @abc.abstractmethod
     def is_epidemic_over(self, Xt: np.ndarray) -> bool:
         """Returns True if all nodes are in a terminal state.
@@ -207,36 +574,198 @@ class MarkovEpidemic(abc.ABC):
         """
         pass
 
-    def simulate(self, T: float, x0: np.ndarray = np.empty(0)) -> None:
-        """Simulate diffusion of Markov epidemic up to time T.
+    @abc.abstractmethod
+    def is_over_given_counts(self, counts: np.ndarray) -> bool:
+        """Same as is_epidemic_over, in O(1) given the compartment counts
+        (counts[s] is the number of nodes in state s) instead of the
+        state vector.
+        """
+        pass
+
+    def _reschedule(self,
+                    queue: IndexedPriorityQueue,
+                    t: float,
+                    i: int,
+                    changed: np.ndarray,
+                    engine: RateEngine,
+                    buffer: RandomBuffer,
+                    ) -> None:
+        """Update the putative firing times of the next reaction method
+        after node i fired at time t.
+        Only the fired node needs a new exponential draw, the firing times
+        of the other nodes whose rate changed from a_old to a_new are
+        rescaled as t + a_old / a_new * (tau - t), which reuses the random
+        number they were drawn from.
         """
+        for j, old_rate, new_rate in zip(changed.tolist(),
+                                         engine.previous_rates.tolist(),
+                                         engine.rates[changed].tolist(),
+                                         ):
+            if new_rate == 0.0:
+                tau = np.inf
+            elif j == i or old_rate == 0.0:
+                tau = t + buffer.standard_exponential() / new_rate
+            elif old_rate == new_rate:
+                continue
+            else:
+                tau = t + old_rate / new_rate * (queue.times[j] - t)
+            queue.update(j, tau)
+
+    def leap_size(self,
+                  Xt: np.ndarray,
+                  rates: np.ndarray,
+                  num_infected_neighbors: np.ndarray,
+                  ) -> float:
+        """Step of the tau_leap simulation method, chosen such that the
+        transition rates are expected to change by at most a fraction
+        tau_leap_epsilon during the leap:
+        - the rate of a node that depends on its infected neighbors
+        (e.g a susceptible node) drifts with the rate at which its
+        neighbors become or stop being infected,
+        - the total number of nodes that transition is at most a fraction
+        of the number of nodes with a non-zero rate.
+        """
+        epsilon = self.tau_leap_epsilon
+        total_rate = np.sum(rates)
+
+        # Rates of the transitions changing the infected status of a node
+        next_states = self.next_state_table[Xt]
+        flips_infected = (Xt == self.infected) \
+            != (next_states == self.infected)
+        drift = self.A.dot(rates * flips_infected)
+
+        exposed_to_drift = (self.contact_rates[Xt] > 0) & (drift > 0)
+        tau_drift = np.min(
+            np.maximum(num_infected_neighbors[exposed_to_drift], 1.0)
+            / drift[exposed_to_drift],
+            initial=np.inf,
+            )
+        tau_total = max(np.sum(rates > 0), 1) / total_rate
+        return epsilon * min(tau_drift, tau_total)
+
+    def _tau_leap_events(self, T: float, Xt: np.ndarray, counts: np.ndarray):
+        """Approximate simulation by tau-leaping: over each leap of size
+        tau, rates are frozen and every node independently transitions
+        with probability 1 - exp(-rate * tau).
+        Yields (t, nodes, old_states, new_states) for each leap, all
+        transitions of a leap happening at its end time t.
+        """
+        next_state_table = self.next_state_table
         t = 0.0
+        while t < T:
+            if self.is_over_given_counts(counts):
+                break
 
-        # By default, start with one infected node drawn uniformly at random.
-        if len(x0) == 0:
-            node = np.random.choice(self.G.nodes)
-            Xt = np.zeros(self.N, dtype='int')
-            Xt[node] = self.infected
-        else:
-            Xt = x0.astype('int')
+            num_infected_neighbors = self.number_infected_neighbors(Xt)
+            rates = self.node_transition_rates(Xt, num_infected_neighbors)
+
+            tau = min(self.leap_size(Xt, rates, num_infected_neighbors),
+                      T - t,
+                      )
+            t += tau
+
+            fired = np.flatnonzero(
+                self.rng.random(self.N) < -np.expm1(-rates * tau)
+                )
+            old_states = Xt[fired]
+            new_states = next_state_table[old_states]
+            Xt[fired] = new_states
+            np.add.at(counts, old_states, -1)
+            np.add.at(counts, new_states, 1)
+            yield t, fired, old_states, new_states
+
+    @property
+    def active_states(self) -> np.ndarray:
+        """active_states[s] is True if a single node in state s is enough
+        for the epidemic not to be over (e.g infected nodes).
+        """
+        one_node = np.eye(self.number_of_states, dtype='int')
+        return np.array(
+            [not self.is_over_given_counts(counts) for counts in one_node]
+        )
+
+    def _numba_events(self,
+                      T: float,
+                      Xt: np.ndarray,
+                      counts: np.ndarray,
+                      block_size: int = 65536,
+                      ):
+        """Run the event loop as a compiled kernel (see gillespie_kernel),
+        block by block: each call consumes pre-drawn random numbers from
+        self.rng and fills fixed-size output buffers.
+        Yields (times, nodes, old_states, new_states) for each block.
+        """
+        graph = self.graph
+        num_infected_neighbors = self.number_infected_neighbors(
+            Xt
+            ).astype('float')
+        sum_tree = SumTree(self.node_transition_rates(Xt,
+                                                      num_infected_neighbors,
+                                                      ))
+        tree = np.array(sum_tree.tree)
+
+        out_times = np.empty(block_size)
+        out_nodes = np.empty(block_size, dtype='int64')
+        out_old_states = np.empty(block_size, dtype=self.state_dtype)
+        out_new_states = np.empty(block_size, dtype=self.state_dtype)
+
+        t = 0.0
+        while True:
+            t, n_events = gillespie_kernel(
+                t, T,
+                graph.in_indptr, graph.in_indices, graph.in_weights,
+                Xt, num_infected_neighbors, tree, sum_tree.size, counts,
+                self.spontaneous_rates, self.contact_rates,
+                self.next_state_table, self.infected, self.active_states,
+                self.rng.standard_exponential(block_size),
+                self.rng.random(block_size),
+                out_times, out_nodes, out_old_states, out_new_states,
+                )
+            yield (out_times[:n_events].copy(),
+                   out_nodes[:n_events].copy(),
+                   out_old_states[:n_events].copy(),
+                   out_new_states[:n_events].copy(),
+                   )
+            if n_events < block_size:
+                break
+
+    def _exact_events(self,
+                      T: float,
+                      Xt: np.ndarray,
+                      counts: np.ndarray,
+                      method: str,
+                      ):
+        """Exact event-by-event simulation.
+        Yields (t, i, old_state, new_state) for each transition.
+        """
+        # Infected neighbors and transition rates are updated incrementally
+        # after each transition rather than recomputed from scratch.
+        engine = RateEngine(self, Xt)
 
-        # List of state vectors of unknown size
-        # (each random transition before T adds a row of size N)
-        X = [Xt]
+        # Random variables are drawn from self.rng in large blocks.
+        buffer = RandomBuffer(self.rng)
 
-        # List of transition times
-        transition_times = [0.0]
+        if method == 'tree':
+            # Node rates stored as the leaves of a binary sum tree.
+            tree = SumTree(engine.rates)
+        elif method == 'next_reaction':
+            # Putative firing time of each node in an indexed heap.
+            with np.errstate(divide='ignore'):
+                firing_times = buffer.standard_exponential(self.N) \
+                    / engine.rates
+            queue = IndexedPriorityQueue(firing_times)
 
+        t = 0.0
         while t < T:
             # If the epidemic died sooner than T
-            if self.is_epidemic_over(Xt):
+            if self.is_over_given_counts(counts):
                 break
 
             # At each step, rates[i] contains
             # the infection/curing rate of node i
-            rates = self.transition_rates(Xt)
+            rates = engine.rates
 
-            if self.simulation_method == 'fastest':
+            if method == 'fastest':
                 # At each step, holding_times[i] contains
                 # the holding time of node i.
                 # Unsurprisingly, passing the array rates as the scale argument
@@ -248,40 +777,366 @@ class MarkovEpidemic(abc.ABC):
                 # that's not that easy to profile due to the nature of the
                 # epidemic simulation -- just know that both the fast and
                 # fastest method are... well... fast enough.)
-                holding_times = np.random.exponential(scale=1/rates)
+                with np.errstate(divide='ignore'):
+                    holding_times = buffer.standard_exponential(self.N) \
+                        / rates
                 # The smallest holding time is the actual transition time
                 i = np.argmin(holding_times)
                 dt = holding_times[i]
-                node = self.nodes_list[i]
-            elif self.simulation_method == 'fast':
+            elif method == 'fast':
                 # Instead of simulating N independant exponential
                 # distributions, simulate a single one with parameter equal to
                 # the sum of the individual parameters.
-                total_rate = np.sum(rates)
-                node = np.random.choice(self.G.nodes, p=rates/total_rate)
-                dt = np.random.exponential(scale=1/total_rate)
+                total_rate = engine.total_rate
+                i = min(
+                    np.searchsorted(np.cumsum(rates),
+                                    buffer.uniform() * total_rate,
+                                    side='right',
+                                    ),
+                    self.N - 1,
+                    )
+                dt = buffer.standard_exponential() / total_rate
+            elif method == 'tree':
+                # Same as the fast method, except that the node is found
+                # by walking down the sum tree in O(log N).
+                total_rate = tree.total
+                i = tree.find(buffer.uniform() * total_rate)
+                dt = buffer.standard_exponential() / total_rate
+            elif method == 'next_reaction':
+                # Gibson-Bruck next reaction method: the next node to fire
+                # is the one with the smallest putative firing time.
+                i, t_next = queue.top()
+                dt = t_next - t
             else:
                 # At each step, holding_times[i] contains
                 # the holding time of node i
                 holding_times = [
-                    np.random.exponential(scale=1/rate) for rate in rates
+                    self.rng.exponential(scale=1/rate) if rate > 0
+                    else np.inf
+                    for rate in rates
                     ]
                 # The smallest holding time is the actual transition time
                 i = np.argmin(holding_times)
                 dt = holding_times[i]
-                node = self.nodes_list[i]
 
             # Move forward
             t += dt
-            transition_times.append(t)
 
             # Change state of transitioned node
-            Xnew = copy(Xt)
-            Xnew[node] = self.next_state(Xt[node])
-            Xt = Xnew
+            old_state = Xt[i]
+            new_state = self.next_state(old_state)
+            changed = engine.transition(i, new_state)
+            if method == 'tree':
+                tree.update(changed, engine.rates[changed])
+            elif method == 'next_reaction':
+                self._reschedule(queue, t, i, changed, engine, buffer)
+            counts[old_state] -= 1
+            counts[new_state] += 1
+            yield t, i, old_state, new_state
+
+    @property
+    def resolved_simulation_method(self) -> str:
+        """Simulation method actually used by simulate.
+        """
+        if self.simulation_method == 'numba' and not NUMBA_AVAILABLE:
+            # Same algorithm, run by the NumPy engine.
+            return 'tree'
+        return self.simulation_method
+
+    def _initial_state(self, x0: np.ndarray) -> np.ndarray:
+        # By default, start with one infected node drawn uniformly at random.
+        if len(x0) == 0:
+            node = self.rng.integers(self.N)
+            Xt = np.zeros(self.N, dtype=self.state_dtype)
+            Xt[node] = self.infected
+        else:
+            Xt = np.asarray(x0).astype(self.state_dtype)
+        return Xt
+
+    def _events(self, T: float, Xt: np.ndarray, counts: np.ndarray) -> tuple:
+        """Returns (batched, events), where events is a generator of the
+        transitions of the epidemic started from Xt (Xt and the compartment
+        counts are updated in place as it runs). Batched simulation methods
+        yield transitions by batches of arrays (times, nodes, old_states,
+        new_states), the others one transition (t, i, old_state, new_state)
+        at a time.
+        """
+        method = self.resolved_simulation_method
+        if method == 'tau_leap':
+            return True, self._tau_leap_events(T, Xt, counts)
+        elif method == 'numba':
+            return True, self._numba_events(T, Xt, counts)
+        else:
+            return False, self._exact_events(T, Xt, counts, method)
+
+    def simulate(self,
+                 T: float,
+                 x0: np.ndarray = np.empty(0),
+                 record_times: np.ndarray = None,
+                 record_every: float = None,
+                 record_states: bool = False,
+                 out_dir: str = None,
+                 ) -> None:
+        """Simulate diffusion of Markov epidemic up to time T.
+        By default every transition is recorded. If record_times (or
+        record_every, for a uniform grid 0, dt, 2dt... up to T) is
+        given, only the compartment counts at these times are recorded,
+        and the full state vectors too if record_states is True:
+        transition_times, number_of_* and X then refer to the grid.
+        If out_dir is given, transitions are recorded out of core in
+        chunked memory-mapped files in that directory (see
+        MemmapEventLog), and can be reloaded with load_trajectory.
+        """
+        if out_dir is not None and (record_times is not None
+                                    or record_every is not None):
+            raise ValueError('out_dir records every transition, it cannot '
+                             'be combined with record_times/record_every.'
+                             )
+
+        self.rng_state = self.rng.bit_generator.state
+        Xt = self._initial_state(x0)
+
+        if record_every is not None:
+            # Tolerance on the number of steps, so that T is not dropped
+            # by rounding (e.g T = 0.3, record_every = 0.1).
+            record_times = record_every \
+                * np.arange(int(np.floor(T / record_every + 1e-9)) + 1)
+
+        if record_times is not None:
+            trajectory = GridRecorder(Xt,
+                                      self.number_of_states,
+                                      record_times,
+                                      record_states=record_states,
+                                      )
+        elif out_dir is not None:
+            trajectory = MemmapEventLog(out_dir, Xt, self.number_of_states)
+        else:
+            # Only the initial state and (time, node, new state) of each
+            # transition are recorded, the full trajectory matrix X is
+            # rebuilt on request.
+            trajectory = EventLog(Xt, self.number_of_states)
+
+        counts = trajectory.current_counts.astype('int64')
+        batched, events = self._events(T, Xt, counts)
+        if batched:
+            for batch in events:
+                trajectory.extend(*batch)
+        else:
+            for event in events:
+                trajectory.append(*event)
+
+        if out_dir is not None:
+            trajectory.close(T)
+        self.trajectory = trajectory
+        self.T = T
+
+    def load_trajectory(self, directory: str) -> None:
+        """Reload a trajectory recorded with simulate(..., out_dir=directory)
+        as lazy memory-mapped arrays (transition_times, number_of_*...).
+        """
+        self.trajectory = MemmapEventLog.open(directory)
+        self.T = self.trajectory.T
+
+    def save_result(self, path: str, compress: bool = True) -> None:
+        """Save the last simulation (event log or grid record, compartment
+        counts, model parameters, horizon, graph fingerprint and random
+        state) to a single versioned .npz file, see results.save_result.
+        compress=False gives larger files that can be memory-mapped.
+        """
+        save_result(self, path, compress=compress)
+
+    def load_result(self, path: str, mmap: bool = False) -> None:
+        """Reload a simulation saved with save_result, whose columns are
+        read lazily (memory-mapped with mmap=True, for uncompressed files).
+        The result must come from the same model on the same graph.
+        """
+        result = load_result(path, mmap=mmap)
+        if result.meta['model'] != type(self).__name__:
+            raise ValueError('Result of a {} model, not {}.'.format(
+                result.meta['model'], type(self).__name__)
+                )
+        if result.meta['graph_fingerprint'] != self.fingerprint:
+            raise ValueError('Result simulated on a different graph.')
+        self.trajectory = result
+        self.T = result.meta['T']
+
+    def iter_events(self,
+                    T: float,
+                    x0: np.ndarray = np.empty(0),
+                    snapshots: bool = False,
+                    ):
+        """Simulate diffusion of Markov epidemic up to time T, as a
+        generator: nothing is stored, and the caller may stop iterating
+        at any time (e.g once half of the nodes are infected).
+        Yields (t, node, old_state, new_state) for each transition, where
+        node is the label of the node in G, or if snapshots is True,
+        (t, counts) where counts[s] is the number of nodes in state s right
+        after the transition (starting with the initial counts at t=0).
+        """
+        Xt = self._initial_state(x0)
+        counts = np.bincount(Xt, minlength=self.number_of_states)
+        current_counts = counts.copy()
+        labels = self.graph.labels
+
+        if snapshots:
+            yield 0.0, current_counts.copy()
+
+        batched, events = self._events(T, Xt, counts)
+        if batched:
+            events = (
+                event
+                for times, nodes, old_states, new_states in events
+                for event in zip(np.broadcast_to(times, len(nodes)),
+                                 nodes,
+                                 old_states,
+                                 new_states,
+                                 )
+            )
+
+        for t, i, old_state, new_state in events:
+            if snapshots:
+                current_counts[old_state] -= 1
+                current_counts[new_state] += 1
+                yield float(t), current_counts.copy()
+            else:
+                yield float(t), labels[i], int(old_state), int(new_state)
+
+    def simulate_ensemble(self,
+                          T: float,
+                          n_runs: int,
+                          x0: np.ndarray = np.empty(0),
+                          ) -> list:
+        """Simulate n_runs independent replicas of the Markov epidemic up
+        to time T, all started from x0 (by default, each replica starts
+        with one infected node drawn uniformly at random).
+
+        The replicas advance together, one transition per replica and per
+        step: states, infected neighbor counts and compartment counts are
+        stored as n_runs x N (or n_runs x number_of_states) arrays, and
+        the node rates of each replica in a sum tree (see SumTree), one
+        per row of a single array. Each step draws the next transition
+        of every replica by walking down all the trees at once, then only
+        updates the nodes that have the fired nodes as neighbor, so that
+        a step costs O(degree x log N) per replica, in vectorized form.
+        Returns the list of the event logs of the replicas, self.trajectory
+        is left untouched.
+        """
+        if len(x0) == 0:
+            X = np.zeros((n_runs, self.N), dtype=self.state_dtype)
+            X[np.arange(n_runs), self.rng.integers(self.N, size=n_runs)] = \
+                self.infected
+        else:
+            X = np.tile(np.asarray(x0).astype(self.state_dtype), (n_runs, 1))
+
+        trajectories = [EventLog(Xr, self.number_of_states) for Xr in X]
+
+        graph = self.graph
+        spontaneous_rates = self.spontaneous_rates
+        contact_rates = self.contact_rates
+        next_state_table = self.next_state_table
+        active_states = self.active_states
+
+        num_infected_neighbors = np.asarray(
+            self.A.dot((X == self.infected).T.astype('float'))
+            ).T.copy()
+        counts = np.bincount(
+            (X + self.number_of_states * np.arange(n_runs)[:, np.newaxis])
+            .ravel(),
+            minlength=n_runs * self.number_of_states,
+            ).reshape(n_runs, self.number_of_states)
+
+        # Sum trees of the rates of all replicas, laid out as in SumTree.
+        size = 1 << int(np.ceil(np.log2(max(self.N, 1))))
+        depth = size.bit_length() - 1
+        tree = np.zeros((n_runs, 2 * size))
+        tree[:, size:size+self.N] = spontaneous_rates[X] \
+            + contact_rates[X] * num_infected_neighbors
+        lo = size // 2
+        while lo >= 1:
+            parents = np.arange(lo, 2 * lo)
+            tree[:, parents] = tree[:, 2*parents] + tree[:, 2*parents+1]
+            lo //= 2
+
+        t = np.zeros(n_runs)
+        active = (counts[:, active_states].sum(axis=1) > 0) & (T > 0)
+        events = []
+
+        while np.any(active):
+            runs = np.flatnonzero(active)
+
+            # Direct method for all replicas: the holding time is exponential
+            # with the total rate, the node is drawn proportionally to its
+            # rate by walking down the sum tree (see SumTree.find).
+            total_rates = tree[runs, 1]
+            dt = self.rng.standard_exponential(len(runs)) / total_rates
+            u = self.rng.random(len(runs)) * total_rates
+            position = np.ones(len(runs), dtype='int64')
+            for _ in range(depth):
+                left = tree[runs, 2*position]
+                go_right = (u >= left) & (tree[runs, 2*position+1] > 0)
+                u = np.where(go_right, u - left, u)
+                position = 2 * position + go_right
+            nodes = position - size
+
+            t[runs] += dt
+            old_states = X[runs, nodes]
+            new_states = next_state_table[old_states]
+            X[runs, nodes] = new_states
+            counts[runs, old_states] -= 1
+            counts[runs, new_states] += 1
+            events.append((runs, t[runs], nodes, old_states, new_states))
+
+            # Nodes that have a fired node as neighbor (column of A), in
+            # the replicas where the fired node started or stopped being
+            # infected. Each replica fires a single node, so that the
+            # (replica, node) pairs are distinct.
+            delta = (new_states == self.infected).astype('int64') \
+                - (old_states == self.infected)
+            flipped = np.flatnonzero(delta)
+            starts = graph.in_indptr[nodes[flipped]]
+            lengths = graph.in_indptr[nodes[flipped] + 1] - starts
+            k = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) \
+                + np.arange(np.sum(lengths))
+            neighbor_runs = np.repeat(runs[flipped], lengths)
+            neighbors = graph.in_indices[k]
+            # No negative counts left by rounding errors
+            num_infected_neighbors[neighbor_runs, neighbors] = np.maximum(
+                num_infected_neighbors[neighbor_runs, neighbors]
+                + np.repeat(delta[flipped], lengths) * graph.in_weights[k],
+                0.0,
+                )
+
+            # Update the rates of the fired nodes and of these neighbors,
+            # then their ancestors, level by level.
+            changed_runs = np.concatenate([runs, neighbor_runs])
+            changed = np.concatenate([nodes, neighbors])
+            x = X[changed_runs, changed]
+            position = size + changed
+            tree[changed_runs, position] = spontaneous_rates[x] \
+                + contact_rates[x] \
+                * num_infected_neighbors[changed_runs, changed]
+            for _ in range(depth):
+                position //= 2
+                tree[changed_runs, position] = \
+                    tree[changed_runs, 2*position] \
+                    + tree[changed_runs, 2*position+1]
+
+            active[runs] = (t[runs] < T) \
+                & (counts[runs][:, active_states].sum(axis=1) > 0)
 
-            X.append(Xt)
+        # Record the transitions of each replica at once.
+        if events:
+            runs, times, nodes, old_states, new_states = [
+                np.concatenate(column) for column in zip(*events)
+            ]
+            order = np.argsort(runs, kind='stable')
+            bounds = np.searchsorted(runs[order], np.arange(n_runs + 1))
+            for r, trajectory in enumerate(trajectories):
+                replica = order[bounds[r]:bounds[r+1]]
+                trajectory.extend(times[replica],
+                                  nodes[replica],
+                                  old_states[replica],
+                                  new_states[replica],
+                                  )
 
-        self.X = np.array(X)
-        self.transition_times = np.array(transition_times)
-        self.T = self.X.shape[0]
+        return trajectories
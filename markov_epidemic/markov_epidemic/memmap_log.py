@@ -0,0 +1,322 @@
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from .trajectory import build_dense, counts_after_transitions, \
+    previous_states
+
+
+class ChunkedArray(NDArrayOperatorsMixin):
+    """Read-only array made of consecutive chunks (typically memory-mapped
+    .npy files) that are only read when indexed.
+    Indexing with an integer, a slice or an array of indices only reads
+    the relevant chunks, while np.asarray reads (and concatenates) them
+    all, as do arithmetic operators, ufuncs and NumPy functions (e.g
+    number_of_infected / N or np.diff), which return in-memory arrays.
+    The chunks themselves are exposed for out-of-core processing.
+    """
+    def __init__(self, chunks: list) -> None:
+        self.chunks = chunks
+        lengths = [len(chunk) for chunk in chunks]
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]) \
+            .astype('int64')
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self),) + self.chunks[0].shape[1:]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.chunks[-1].dtype
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        array = np.concatenate(self.chunks)
+        return array if dtype is None else array.astype(dtype)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if any(isinstance(array, ChunkedArray)
+               for array in kwargs.get('out', ())):
+            raise ValueError('ChunkedArray is read-only.')
+        inputs = [np.asarray(array) if isinstance(array, ChunkedArray)
+                  else array for array in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    def __array_function__(self, func, types, args, kwargs):
+        def materialize(value):
+            if isinstance(value, ChunkedArray):
+                return np.asarray(value)
+            if isinstance(value, (list, tuple)):
+                return type(value)(materialize(item) for item in value)
+            return value
+        return func(*materialize(args), **materialize(kwargs))
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return self[key[0]][(slice(None),) + key[1:]]
+        if np.isscalar(key):
+            i = int(key) + (len(self) if key < 0 else 0)
+            if not 0 <= i < len(self):
+                raise IndexError('index {} is out of bounds'.format(key))
+            k = np.searchsorted(self.offsets, i, side='right') - 1
+            return self.chunks[k][i - self.offsets[k]]
+
+        if isinstance(key, slice):
+            indices = np.arange(*key.indices(len(self)))
+        else:
+            indices = np.asarray(key)
+            if indices.dtype == bool:
+                if len(indices) != len(self):
+                    raise IndexError('boolean index of length {} does not '
+                                     'match length {}'.format(len(indices),
+                                                              len(self)))
+                indices = np.flatnonzero(indices)
+            indices = np.where(indices < 0, indices + len(self), indices)
+        which_chunk = np.searchsorted(self.offsets, indices, side='right') - 1
+        result = np.empty((len(indices),) + self.shape[1:], dtype=self.dtype)
+        for k in np.unique(which_chunk):
+            mask = which_chunk == k
+            result[mask] = self.chunks[k][indices[mask] - self.offsets[k]]
+        return result
+
+    def column(self, j: int) -> 'ChunkedArray':
+        """Lazy view of column j of a 2d chunked array.
+        """
+        return ChunkedArray([chunk[:, j] for chunk in self.chunks])
+
+
+class MemmapEventLog:
+    """Event log (see EventLog) stored out of core: transition times,
+    nodes, new states and compartment counts are appended in fixed-size
+    chunks to memory-mapped .npy files in directory, so that the number of
+    transitions is only limited by disk space.
+    Once closed (or reopened with MemmapEventLog.open), the columns are
+    exposed as lazy ChunkedArray objects backed by the memory-mapped
+    files, without a full read.
+    """
+    columns = ['times', 'nodes', 'states', 'counts']
+
+    def __init__(self,
+                 directory: str,
+                 x0: np.ndarray,
+                 n_states: int,
+                 chunk_size: int = 2 ** 20,
+                 ) -> None:
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.n_states = n_states
+        os.makedirs(directory, exist_ok=True)
+
+        self.x0 = np.array(x0)
+        np.save(os.path.join(directory, 'x0.npy'), self.x0)
+        self.initial_counts = np.bincount(
+            self.x0.astype('int64'),
+            minlength=n_states,
+            ).astype('int32')
+        self.current_counts = self.initial_counts.copy()
+
+        self._size = 0
+        self._n_chunks = 0
+        self._position = 0
+        self._chunk = None
+        self._closed = False
+        self.T = None
+
+    def __len__(self) -> int:
+        """Number of recorded transitions.
+        """
+        return self._size
+
+    @property
+    def N(self) -> int:
+        return len(self.x0)
+
+    def _path(self, column: str, k: int) -> str:
+        return os.path.join(self.directory, '{}_{:05d}.npy'.format(column, k))
+
+    def _new_chunk(self) -> None:
+        """Flush the current chunk and start a new one.
+        """
+        self._flush()
+        shapes = {
+            'times': ((self.chunk_size,), 'float'),
+            'nodes': ((self.chunk_size,), 'int64'),
+            'states': ((self.chunk_size,), self.x0.dtype),
+            'counts': ((self.chunk_size, self.n_states), 'int32'),
+        }
+        self._chunk = {
+            column: open_memmap(self._path(column, self._n_chunks),
+                                mode='w+',
+                                dtype=dtype,
+                                shape=shape,
+                                )
+            for column, (shape, dtype) in shapes.items()
+        }
+        self._n_chunks += 1
+        self._position = 0
+
+    def _flush(self) -> None:
+        if self._chunk is not None:
+            for array in self._chunk.values():
+                array.flush()
+
+    def append(self,
+               t: float,
+               node: int,
+               old_state: int,
+               new_state: int,
+               ) -> None:
+        self.extend(t, [node], [old_state], [new_state])
+
+    def extend(self,
+               t,
+               nodes: np.ndarray,
+               old_states: np.ndarray,
+               new_states: np.ndarray,
+               ) -> None:
+        """Same as EventLog.extend.
+        """
+        n = len(nodes)
+        if n == 0:
+            return
+        times = np.broadcast_to(t, n)
+        nodes = np.asarray(nodes)
+        new_states = np.asarray(new_states)
+
+        # Compartment counts after each of the transitions
+        counts = counts_after_transitions(self.current_counts,
+                                          old_states,
+                                          new_states,
+                                          )
+        self.current_counts = counts[-1].copy()
+
+        start = 0
+        while start < n:
+            if self._chunk is None or self._position == self.chunk_size:
+                self._new_chunk()
+            end = min(n, start + self.chunk_size - self._position)
+            chunk_slice = slice(self._position,
+                                self._position + end - start,
+                                )
+            self._chunk['times'][chunk_slice] = times[start:end]
+            self._chunk['nodes'][chunk_slice] = nodes[start:end]
+            self._chunk['states'][chunk_slice] = new_states[start:end]
+            self._chunk['counts'][chunk_slice] = counts[start:end]
+            self._position += end - start
+            start = end
+        self._size += n
+
+    def close(self, T: float = None) -> None:
+        """Truncate the last chunk to its actual length, write the
+        metadata (with the horizon T of the simulation, if given) and
+        switch to read-only memory-mapped access.
+        """
+        if self._closed:
+            return
+        self.T = T
+        self._flush()
+        if self._chunk is not None and self._position < self.chunk_size:
+            last = {
+                column: np.array(array[:self._position])
+                for column, array in self._chunk.items()
+            }
+            self._chunk = None
+            for column, array in last.items():
+                np.save(self._path(column, self._n_chunks - 1), array)
+        self._chunk = None
+
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(
+                {
+                    'version': 1,
+                    'n_events': self._size,
+                    'n_chunks': self._n_chunks,
+                    'chunk_size': self.chunk_size,
+                    'n_states': self.n_states,
+                    'T': self.T,
+                },
+                f,
+            )
+        self._closed = True
+
+    @classmethod
+    def open(cls, directory: str) -> 'MemmapEventLog':
+        """Reopen a closed event log for lazy read-only access.
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        log = cls.__new__(cls)
+        log.directory = directory
+        log.chunk_size = meta['chunk_size']
+        log.n_states = meta['n_states']
+        log.T = meta.get('T')
+        log.x0 = np.load(os.path.join(directory, 'x0.npy'))
+        log.initial_counts = np.bincount(
+            log.x0.astype('int64'),
+            minlength=log.n_states,
+            ).astype('int32')
+        log._size = meta['n_events']
+        log._n_chunks = meta['n_chunks']
+        log._chunk = None
+        log._closed = True
+        log.current_counts = log.counts[len(log)].copy()
+        return log
+
+    def _column(self, column: str) -> ChunkedArray:
+        if not self._closed:
+            raise ValueError('The event log must be closed before reading.')
+        chunks = [
+            np.load(self._path(column, k), mmap_mode='r')
+            for k in range(self._n_chunks)
+        ]
+        empty = np.empty((0,) + ((self.n_states,) if column == 'counts'
+                                 else ()))
+        return ChunkedArray(chunks or [empty])
+
+    @property
+    def times(self) -> ChunkedArray:
+        return self._column('times')
+
+    @property
+    def nodes(self) -> ChunkedArray:
+        return self._column('nodes')
+
+    @property
+    def new_states(self) -> ChunkedArray:
+        return self._column('states')
+
+    @property
+    def old_states(self) -> np.ndarray:
+        """State of the transitioned node just before each transition
+        (see EventLog.old_states), read in memory.
+        """
+        return previous_states(self.x0, self.nodes, self.new_states)
+
+    @property
+    def transition_times(self) -> ChunkedArray:
+        """Transition times, starting with the initial time 0.
+        """
+        return ChunkedArray([np.zeros(1)] + self.times.chunks)
+
+    @property
+    def counts(self) -> ChunkedArray:
+        """Compartment counts at each transition time, starting with the
+        initial counts.
+        """
+        return ChunkedArray(
+            [self.initial_counts[np.newaxis]] + self._column('counts').chunks
+            )
+
+    def count(self, state: int) -> ChunkedArray:
+        """Number of nodes in a given state at each transition time.
+        """
+        return self.counts.column(state)
+
+    def to_dense(self, packed: bool = False) -> np.ndarray:
+        """Build the full trajectory matrix in memory (see build_dense),
+        bit-packed if packed.
+        """
+        return build_dense(self.x0, self.nodes, self.new_states, packed)
@@ -0,0 +1,247 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from copy import copy
+from scipy.stats import norm
+
+
+# Epidemic object sent once to each worker process by _init_worker,
+# rather than pickled again with every single run.
+_worker_epidemic = None
+
+
+def _init_worker(epidemic) -> None:
+    global _worker_epidemic
+    _worker_epidemic = epidemic
+
+
+def _simulate_worker(run: int,
+                     seed_sequence: np.random.SeedSequence,
+                     T: float,
+                     x0: np.ndarray,
+                     initial_infected: int,
+                     ) -> tuple:
+    """Run a single simulation in a worker process, with a random
+    Generator seeded from the SeedSequence of this run only.
+    """
+    _worker_epidemic.rng = np.random.default_rng(seed_sequence)
+    if initial_infected > 0:
+        x0 = _worker_epidemic.random_seed_nodes(initial_infected)
+    _worker_epidemic.simulate(T, x0)
+    return run, _worker_epidemic.trajectory
+
+
+def _summary_worker(run: int,
+                    seed_sequence: np.random.SeedSequence,
+                    T: float,
+                    x0: np.ndarray,
+                    initial_infected: int,
+                    ) -> tuple:
+    """Same as _simulate_worker, but only returns the summary statistics
+    of the run (see MarkovEpidemic.summary).
+    """
+    _simulate_worker(run, seed_sequence, T, x0, initial_infected)
+    return run, _worker_epidemic.summary()
+
+
+def run_monte_carlo(epidemic,
+                    T: float,
+                    n_runs: int,
+                    x0: np.ndarray = np.empty(0),
+                    initial_infected: int = 0,
+                    seed=None,
+                    max_workers: int = None,
+                    ):
+    """Run n_runs independent simulations of epidemic up to time T across
+    a pool of processes and yield (run, trajectory) pairs as soon as each
+    run finishes (hence not necessarily in order).
+
+    Each run draws its randomness from its own stream, spawned from
+    np.random.SeedSequence(seed), so run k gives the same trajectory
+    whatever the number of workers and the order of completion.
+    If initial_infected > 0, each run starts from its own random seed
+    group of that size (drawn from the run's stream), otherwise from x0
+    as in simulate.
+    Only a few runs per worker are queued at a time, and the remaining
+    runs are cancelled if the caller stops iterating early.
+    """
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_runs)
+
+    # Do not ship a previous simulation to the workers.
+    epidemic = copy(epidemic)
+    epidemic.trajectory = None
+
+    executor = ProcessPoolExecutor(max_workers=max_workers,
+                                   initializer=_init_worker,
+                                   initargs=(epidemic,),
+                                   )
+    pending = set()
+    max_pending = 4 * (max_workers or os.cpu_count() or 1)
+    try:
+        for run, seed_sequence in enumerate(seed_sequences):
+            # Bound the number of queued runs (and of finished
+            # trajectories kept alive).
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED,
+                                         )
+                for future in finished:
+                    yield future.result()
+            pending.add(executor.submit(_simulate_worker,
+                                        run,
+                                        seed_sequence,
+                                        T,
+                                        x0,
+                                        initial_infected,
+                                        ))
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
+    finally:
+        # Like shutdown(cancel_futures=True), which needs Python 3.9
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
+
+
+class StreamingStatistics:
+    """Running number of samples, mean and variance, updated one sample at
+    a time with Welford's algorithm (numerically stable, O(1) memory).
+    """
+    def __init__(self) -> None:
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, value: float) -> None:
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.n - 1) if self.n > 1 else np.inf
+
+    @property
+    def std_error(self) -> float:
+        return np.sqrt(self.variance / self.n) if self.n > 0 else np.inf
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        """Half width of the normal confidence interval of the mean.
+        """
+        return norm.ppf(0.5 + confidence / 2) * self.std_error
+
+
+# Observables of estimate_observable, as keys of MarkovEpidemic.summary.
+OBSERVABLES = {
+    'extinction_time': 'lifetime',
+    'final_size': 'final_size',
+    'peak': 'peak',
+    'peak_time': 'peak_time',
+}
+
+
+def estimate_observable(epidemic,
+                        T: float,
+                        observable: str = 'final_size',
+                        atol: float = None,
+                        rtol: float = 0.05,
+                        confidence: float = 0.95,
+                        x0: np.ndarray = np.empty(0),
+                        initial_infected: int = 0,
+                        batch_size: int = 32,
+                        min_runs: int = 32,
+                        max_runs: int = 10000,
+                        max_censored_fraction: float = 0.05,
+                        seed=None,
+                        max_workers: int = None,
+                        ) -> dict:
+    """Estimate the expectation of an observable of the epidemic
+    ('extinction_time', 'final_size', 'peak' or 'peak_time') by running
+    simulations up to time T in parallel, batch after batch, until the
+    half width of its confidence interval is below atol (or below rtol
+    times the estimate if atol is None), after at least min_runs and at
+    most max_runs runs.
+
+    Runs that are still going on at T are censored, not discarded: they
+    contribute the value of the observable at T (T itself for the
+    extinction time), so the estimate is that of the observable
+    restricted to [0, T] (e.g E[min(extinction time, T)]), which
+    coincides with the unrestricted one when no run is censored. The
+    fraction of censored runs and the mean over extinct runs only are
+    reported too. A narrow interval around a restricted estimate says
+    little about the unrestricted one (e.g when every run is censored,
+    the extinction time estimate is exactly T), so the estimate is only
+    reported as converged if at most max_censored_fraction of the runs
+    were censored; otherwise, T should be increased.
+
+    Runs are seeded as in run_monte_carlo (run k always uses the k-th
+    stream spawned from seed), so the result does not depend on the
+    number of workers.
+    """
+    if observable not in OBSERVABLES:
+        raise ValueError('Unknown observable {}, expected one of {}.'.format(
+            observable, ', '.join(OBSERVABLES))
+            )
+    key = OBSERVABLES[observable]
+
+    seed_sequence = np.random.SeedSequence(seed)
+    statistics = StreamingStatistics()
+    uncensored = StreamingStatistics()
+    n_censored = 0
+    half_width = np.inf
+    converged = False
+
+    epidemic = copy(epidemic)
+    epidemic.trajectory = None
+
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=_init_worker,
+                             initargs=(epidemic,),
+                             ) as executor:
+        while statistics.n < max_runs:
+            size = min(batch_size, max_runs - statistics.n)
+            futures = [
+                executor.submit(_summary_worker,
+                                statistics.n + k,
+                                child,
+                                T,
+                                x0,
+                                initial_infected,
+                                )
+                for k, child in enumerate(seed_sequence.spawn(size))
+            ]
+            # Update in run order, for reproducibility.
+            summaries = sorted(future.result() for future in futures)
+            for _, summary in summaries:
+                if summary['extinct']:
+                    value = summary[key]
+                    uncensored.update(value)
+                else:
+                    value = T if observable == 'extinction_time' \
+                        else summary[key]
+                    n_censored += 1
+                statistics.update(value)
+
+            if statistics.n >= min_runs:
+                half_width = statistics.half_width(confidence)
+                tolerance = atol if atol is not None \
+                    else rtol * abs(statistics.mean)
+                if half_width <= tolerance:
+                    # More runs would not make censoring less frequent.
+                    converged = n_censored / statistics.n \
+                        <= max_censored_fraction
+                    break
+
+    return {
+        'estimate': statistics.mean,
+        'half_width': half_width,
+        'std_error': statistics.std_error,
+        'n_runs': statistics.n,
+        'n_censored': n_censored,
+        'censored_fraction': n_censored / statistics.n,
+        'mean_uncensored': uncensored.mean if uncensored.n else np.nan,
+        'converged': converged,
+    }
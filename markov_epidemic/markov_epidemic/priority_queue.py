@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class IndexedPriorityQueue:
+    """Binary min-heap of the putative firing times of nodes 0, ..., N-1,
+    indexed by node so that the firing time of any node can be changed
+    in O(log N) (as required by the next reaction method).
+
+    heap[k] is the node stored at position k of the heap, position[i] the
+    position of node i in the heap and times[i] its firing time.
+    """
+    def __init__(self, times: np.ndarray) -> None:
+        self.times = np.asarray(times, dtype='float').tolist()
+        order = np.argsort(self.times, kind='stable')
+        # A sorted array satisfies the heap property.
+        self.heap = order.tolist()
+        self.position = np.empty(len(order), dtype='int64')
+        self.position[order] = np.arange(len(order))
+        self.position = self.position.tolist()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def top(self) -> tuple:
+        """Returns the node with the smallest firing time and that time.
+        """
+        node = self.heap[0]
+        return node, self.times[node]
+
+    def update(self, node: int, time: float) -> None:
+        """Change the firing time of node and restore the heap property.
+        """
+        old_time = self.times[node]
+        self.times[node] = time
+        if time < old_time:
+            self._sift_up(self.position[node])
+        elif time > old_time:
+            self._sift_down(self.position[node])
+
+    def _swap(self, k1: int, k2: int) -> None:
+        heap = self.heap
+        heap[k1], heap[k2] = heap[k2], heap[k1]
+        self.position[heap[k1]] = k1
+        self.position[heap[k2]] = k2
+
+    def _sift_up(self, k: int) -> None:
+        heap, times = self.heap, self.times
+        while k > 0:
+            parent = (k - 1) >> 1
+            if times[heap[k]] < times[heap[parent]]:
+                self._swap(k, parent)
+                k = parent
+            else:
+                break
+
+    def _sift_down(self, k: int) -> None:
+        heap, times = self.heap, self.times
+        n = len(heap)
+        while True:
+            smallest = k
+            left = 2 * k + 1
+            right = left + 1
+            if left < n and times[heap[left]] < times[heap[smallest]]:
+                smallest = left
+            if right < n and times[heap[right]] < times[heap[smallest]]:
+                smallest = right
+            if smallest == k:
+                break
+            self._swap(k, smallest)
+            k = smallest
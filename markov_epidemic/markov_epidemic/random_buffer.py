@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class RandomBuffer:
+    """Draws standard exponential and uniform random variables from a
+    numpy Generator in large blocks, and serves them one at a time (or a
+    few at a time) to the simulation loop.
+    Exponential holding times with rate a are obtained by rescaling
+    standard exponentials by 1/a, which replaces many small calls to the
+    distribution functions by a few large ones. For a given Generator
+    state, the sequence of served values is deterministic.
+    """
+    def __init__(self,
+                 rng: np.random.Generator,
+                 block_size: int = 8192,
+                 ) -> None:
+        self.rng = rng
+        self.block_size = block_size
+        self._exponentials = np.empty(0)
+        self._next_exponential = 0
+        self._uniforms = np.empty(0)
+        self._next_uniform = 0
+
+    def standard_exponential(self, size: int = None):
+        """Returns a single standard exponential if size is None,
+        otherwise an array of size of them.
+        """
+        n = 1 if size is None else size
+        if self._next_exponential + n > len(self._exponentials):
+            self._exponentials = self.rng.standard_exponential(
+                max(self.block_size, n)
+                )
+            self._next_exponential = 0
+        start = self._next_exponential
+        self._next_exponential += n
+        if size is None:
+            return self._exponentials[start]
+        return self._exponentials[start:start+n]
+
+    def uniform(self) -> float:
+        """Returns a single uniform random variable on [0, 1).
+        """
+        if self._next_uniform == len(self._uniforms):
+            self._uniforms = self.rng.random(self.block_size)
+            self._next_uniform = 0
+        self._next_uniform += 1
+        return self._uniforms[self._next_uniform-1]
@@ -0,0 +1,185 @@
+import io
+import json
+import zipfile
+import numpy as np
+from .trajectory import GridRecorder, build_dense, previous_states
+
+
+# Version of the result container, bumped on incompatible changes.
+RESULT_FORMAT_VERSION = 1
+
+
+def _memmap_member(path: str, zf: zipfile.ZipFile, name: str) -> np.ndarray:
+    """Memory-map an uncompressed .npy member of a zip archive: its bytes
+    are stored contiguously in the archive, right after a local header.
+    """
+    info = zf.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError('Only uncompressed results can be memory-mapped.')
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        local_header = f.read(30)
+        name_length = int.from_bytes(local_header[26:28], 'little')
+        extra_length = int.from_bytes(local_header[28:30], 'little')
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+        if np.lib.format.read_magic(f) == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    if shape == (0,) or 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path,
+                     dtype=dtype,
+                     mode='r',
+                     offset=offset,
+                     shape=shape,
+                     order='F' if fortran_order else 'C',
+                     )
+
+
+class SimulationResult:
+    """Simulation result loaded with load_result. Columns (x0,
+    transition_times, counts, and nodes and new_states for event records,
+    or states for grid records) are only read when accessed, and are
+    memory-mapped if the result was saved uncompressed and loaded with
+    mmap=True, so that partial reads do not load the whole column.
+    meta holds the model, parameters, horizon, graph fingerprint and
+    random state of the simulation.
+    """
+    def __init__(self, path: str, mmap: bool = False) -> None:
+        self.path = path
+        self.mmap = mmap
+        self._columns = {}
+        with zipfile.ZipFile(path) as zf:
+            self.column_names = [
+                name[:-len('.npy')] for name in zf.namelist()
+            ]
+            meta = np.load(io.BytesIO(zf.read('meta.npy')))
+        self.column_names.remove('meta')
+        self.meta = json.loads(meta.tobytes().decode())
+        if self.meta['format_version'] > RESULT_FORMAT_VERSION:
+            raise ValueError(
+                'Result saved with a newer format version ({}).'.format(
+                    self.meta['format_version'])
+                )
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            if name not in self.column_names:
+                raise ValueError(
+                    '{} was not recorded in this result.'.format(name)
+                    )
+            with zipfile.ZipFile(self.path) as zf:
+                if self.mmap:
+                    array = _memmap_member(self.path, zf, name + '.npy')
+                else:
+                    array = np.load(io.BytesIO(zf.read(name + '.npy')))
+            self._columns[name] = array
+        return self._columns[name]
+
+    def __len__(self) -> int:
+        """Number of transitions of the simulation.
+        """
+        return self.meta['n_transitions']
+
+    @property
+    def x0(self) -> np.ndarray:
+        return self.column('x0')
+
+    @property
+    def transition_times(self) -> np.ndarray:
+        return self.column('transition_times')
+
+    @property
+    def counts(self) -> np.ndarray:
+        return self.column('counts')
+
+    @property
+    def current_counts(self) -> np.ndarray:
+        """Compartment counts at the end of the simulation.
+        """
+        return np.array(self.counts[-1])
+
+    def count(self, state: int) -> np.ndarray:
+        return self.counts[:, state]
+
+    @property
+    def nodes(self) -> np.ndarray:
+        return self.column('nodes')
+
+    @property
+    def new_states(self) -> np.ndarray:
+        return self.column('new_states')
+
+    @property
+    def old_states(self) -> np.ndarray:
+        """State of the transitioned node just before each transition
+        (see EventLog.old_states).
+        """
+        return previous_states(self.x0, self.nodes, self.new_states)
+
+    def to_dense(self, packed: bool = False) -> np.ndarray:
+        """Full trajectory matrix (or state vectors at the grid times, for
+        results recorded on a fixed grid).
+        """
+        if self.meta['recording'] == 'grid':
+            states = self.column('states')
+            return np.packbits(states, axis=1) if packed else states
+        return build_dense(self.x0, self.nodes, self.new_states, packed)
+
+
+def save_result(epidemic, path: str, compress: bool = True) -> None:
+    """Save the last simulation of epidemic to path, as a zip archive of
+    .npy columns (like np.savez) plus a JSON metadata member.
+    Compressed results are smaller, uncompressed ones can be
+    memory-mapped column by column when loaded.
+    """
+    trajectory = epidemic.trajectory
+    if trajectory is None:
+        raise ValueError('Nothing to save, call simulate first.')
+
+    columns = {
+        'x0': np.asarray(trajectory.x0),
+        'transition_times': np.asarray(trajectory.transition_times),
+        'counts': np.asarray(trajectory.counts),
+    }
+    if isinstance(trajectory, GridRecorder):
+        recording = 'grid'
+        if trajectory.record_states:
+            columns['states'] = trajectory.to_dense()
+    else:
+        recording = 'events'
+        columns['nodes'] = np.asarray(trajectory.nodes)
+        columns['new_states'] = np.asarray(trajectory.new_states)
+
+    seed_seq = getattr(epidemic.rng.bit_generator, 'seed_seq', None)
+    meta = {
+        'format_version': RESULT_FORMAT_VERSION,
+        'model': type(epidemic).__name__,
+        'parameters': {
+            name: float(rate) for name, rate in epidemic.parameters.items()
+        },
+        'simulation_method': epidemic.simulation_method,
+        'T': epidemic.T,
+        'N': epidemic.N,
+        'n_transitions': len(trajectory),
+        'recording': recording,
+        'graph_fingerprint': epidemic.fingerprint,
+        'seed': None if seed_seq is None else {
+            'entropy': seed_seq.entropy,
+            'spawn_key': list(seed_seq.spawn_key),
+        },
+        'rng_state': epidemic.rng_state,
+    }
+    columns['meta'] = np.frombuffer(json.dumps(meta).encode(), dtype='uint8')
+
+    if compress:
+        np.savez_compressed(path, **columns)
+    else:
+        np.savez(path, **columns)
+
+
+def load_result(path: str, mmap: bool = False) -> SimulationResult:
+    return SimulationResult(path, mmap=mmap)
@@ -12,14 +12,21 @@ class MarkovSIR(MarkovEpidemic):
                  recovery_rate: float,
                  G: nx.Graph,
                  simulation_method: str = 'fastest',
+                 rng=None,
                  ) -> None:
         self._infection_rate = infection_rate
         self._recovery_rate = recovery_rate
 
-        super().__init__(G, simulation_method=simulation_method)
+        super().__init__(G,
+                         simulation_method=simulation_method,
+                         rng=rng,
+                         )
 
-        self.X = np.empty(0)
-        self.transition_times = np.empty(0)
+    @property
+    def number_of_states(self) -> int:
+        """Susceptible (0), infected (1) and recovered (2).
+        """
+        return 3
 
     @property
     def recovered(self) -> int:
@@ -48,7 +55,7 @@ class MarkovSIR(MarkovEpidemic):
         """Returns the number of recovered individuals at
         each transition time of the simulated epidemic.
         """
-        return np.sum(self.X == self.recovered, axis=1)
+        return self.number_in_state(self.recovered)
 
     @property
     def effective_diffusion_rate(self) -> float:
@@ -71,18 +78,28 @@ class MarkovSIR(MarkovEpidemic):
     def is_epidemic_over(self, Xt: np.ndarray) -> bool:
         return np.sum(Xt == self.infected) == 0
 
-    def transition_rates(self, Xt: np.ndarray) -> np.ndarray:
-        num_infected_neighbors = self.number_infected_neighbors(Xt)
+    def is_over_given_counts(self, counts: np.ndarray) -> bool:
+        return counts[self.infected] == 0
 
-        return np.array(
-            [
-                0 if Xt[node] == self.recovered
-                else (self.infection_rate * num_infected_neighbors[node]
-                      if Xt[node] == self.susceptible
-                      else self.recovery_rate)
-                for node in self.G.nodes
-            ]
-        )
+    @property
+    def parameters(self) -> dict:
+        return {
+            'infection_rate': self.infection_rate,
+            'recovery_rate': self.recovery_rate,
+        }
+
+    @property
+    def spontaneous_rates(self) -> np.ndarray:
+        """Rates of transitions that do not depend on neighbors,
+        indexed by state.
+        """
+        return np.array([0.0, self.recovery_rate, 0.0])
+
+    @property
+    def contact_rates(self) -> np.ndarray:
+        """Rates of transitions per infected neighbor, indexed by state.
+        """
+        return np.array([self.infection_rate, 0.0, 0.0])
 
     def deterministic_baseline_ODEs(self,
                                     t: float,
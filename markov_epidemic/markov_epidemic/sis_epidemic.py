@@ -1,8 +1,26 @@
 import numpy as np
 import networkx as nx
+from scipy.stats import norm
 from .markov_epidemic import MarkovEpidemic
 
 
+def _event_batches(batched: bool, events, size: int = 1024):
+    """Group the transitions yielded one at a time by exact simulation
+    methods into batches of arrays, as yielded by batched methods.
+    """
+    if batched:
+        yield from events
+        return
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) == size:
+            yield tuple(np.array(column) for column in zip(*batch))
+            batch = []
+    if batch:
+        yield tuple(np.array(column) for column in zip(*batch))
+
+
 class MarkovSIS(MarkovEpidemic):
     """Class to simulate Markov epidemics
     in the Susceptible-Infected-Removed model.
@@ -12,14 +30,21 @@ class MarkovSIS(MarkovEpidemic):
                  recovery_rate: float,
                  G: nx.Graph,
                  simulation_method: str = 'fastest',
+                 rng=None,
                  ) -> None:
         self._infection_rate = infection_rate
         self._recovery_rate = recovery_rate
 
-        super().__init__(G, simulation_method=simulation_method)
+        super().__init__(G,
+                         simulation_method=simulation_method,
+                         rng=rng,
+                         )
 
-        self.X = np.empty(0)
-        self.transition_times = np.empty(0)
+    @property
+    def number_of_states(self) -> int:
+        """Susceptible (0) and infected (1).
+        """
+        return 2
 
     @property
     def infection_rate(self) -> float:
@@ -43,15 +68,25 @@ class MarkovSIS(MarkovEpidemic):
         """
         return self.infection_rate / self.recovery_rate
 
-    def transition_rates(self, Xt: np.ndarray) -> np.ndarray:
-        num_infected_neighbors = self.number_infected_neighbors(Xt)
-        return np.array(
-            [
-                self.infection_rate * num_infected_neighbors[node]
-                if Xt[node] == 0
-                else self.recovery_rate for node in self.G.nodes
-            ]
-        )
+    @property
+    def parameters(self) -> dict:
+        return {
+            'infection_rate': self.infection_rate,
+            'recovery_rate': self.recovery_rate,
+        }
+
+    @property
+    def spontaneous_rates(self) -> np.ndarray:
+        """Rates of transitions that do not depend on neighbors,
+        indexed by state.
+        """
+        return np.array([0.0, self.recovery_rate])
+
+    @property
+    def contact_rates(self) -> np.ndarray:
+        """Rates of transitions per infected neighbor, indexed by state.
+        """
+        return np.array([self.infection_rate, 0.0])
 
     def next_state(self, x: int) -> int:
         if x == self.susceptible:
@@ -64,6 +99,9 @@ class MarkovSIS(MarkovEpidemic):
     def is_epidemic_over(self, Xt: np.ndarray) -> bool:
         return np.sum(Xt == self.infected) == 0
 
+    def is_over_given_counts(self, counts: np.ndarray) -> bool:
+        return counts[self.infected] == 0
+
     def deterministic_baseline_ODEs(self,
                                     t: float,
                                     y: np.ndarray
@@ -81,3 +119,149 @@ class MarkovSIS(MarkovEpidemic):
 
     def deterministic_baseline_init(self, initial_infected: int) -> np.ndarray:
         return np.array([self.N-initial_infected, initial_infected])
+
+    def simulate_quasi_stationary(self,
+                                  x0: np.ndarray = np.empty(0),
+                                  relaxation_time: float = 50.0,
+                                  batch_time: float = 10.0,
+                                  n_stored: int = 100,
+                                  store_every: float = 1.0,
+                                  rtol: float = 0.01,
+                                  confidence: float = 0.95,
+                                  min_batches: int = 10,
+                                  max_time: float = 1e4,
+                                  ) -> dict:
+        """Estimate the quasi-stationary (endemic) prevalence, i.e the
+        fraction of infected nodes conditionally on survival, without
+        waiting for extinction.
+        Uses the quasi-stationary method of de Oliveira and Dickman:
+        n_stored configurations visited by the process are kept (one is
+        replaced at random every store_every time units), and whenever
+        the epidemic dies out, it restarts from one of them drawn at
+        random.
+        After relaxation_time, the prevalence is averaged over time in
+        consecutive batches of batch_time; the simulation stops once the
+        confidence interval of the mean of the batches is within rtol
+        of the estimate (after at least min_batches batches, for which
+        max_time must leave room), or after max_time.
+        Returns a dict with the prevalence, the half width of its
+        confidence interval, the batch means, the number of extinctions,
+        the simulated time and whether the estimate converged.
+        """
+        if batch_time <= 0 or min_batches < 2:
+            raise ValueError('Expected batch_time > 0 and min_batches >= 2.')
+        if max_time < relaxation_time + min_batches * batch_time:
+            raise ValueError(
+                'max_time must leave room for min_batches batches after '
+                'relaxation_time (max_time >= {}).'.format(
+                    relaxation_time + min_batches * batch_time)
+                )
+
+        Xt = self._initial_state(x0)
+        counts = np.bincount(Xt, minlength=self.number_of_states) \
+            .astype('int64')
+        stored = [Xt.copy()]
+        next_store = store_every
+        n_extinctions = 0
+
+        # A single event stream runs up to the horizon (restarting from a
+        # stored configuration on extinction); its time integral of the
+        # number of infected nodes is only cut at the batch boundaries.
+        n_batches = int(np.ceil((max_time - relaxation_time) / batch_time))
+        horizon = relaxation_time + n_batches * batch_time
+        boundary = relaxation_time
+        area = 0.0
+        boundary_area = None
+
+        z = norm.ppf(0.5 + confidence / 2)
+        batch_means = []
+        half_width = np.inf
+        converged = False
+
+        def integrate(breakpoints: np.ndarray, values: np.ndarray) -> bool:
+            """Add the integral of values[k] over [breakpoints[k],
+            breakpoints[k + 1]) to area, closing the batches whose
+            boundary is crossed, and return True once converged.
+            """
+            nonlocal area, boundary, boundary_area, half_width, converged
+            cumulative = area + np.concatenate(
+                ([0.0], np.cumsum(values * np.diff(breakpoints)))
+                )
+            while boundary <= min(breakpoints[-1], horizon):
+                k = min(np.searchsorted(breakpoints, boundary, side='right'),
+                        len(values),
+                        ) - 1
+                boundary_value = cumulative[k] \
+                    + values[k] * (boundary - breakpoints[k])
+                if boundary_area is not None:
+                    batch_means.append((boundary_value - boundary_area)
+                                       / (batch_time * self.N))
+                    if len(batch_means) >= min_batches:
+                        half_width = z * np.std(batch_means, ddof=1) \
+                            / np.sqrt(len(batch_means))
+                        if half_width <= rtol * np.mean(batch_means):
+                            converged = True
+                boundary_area = boundary_value
+                boundary += batch_time
+                if converged:
+                    return True
+            area = cumulative[-1]
+            return False
+
+        t = 0.0
+        n_infected = counts[self.infected]
+        while t < horizon and not converged:
+            if self.is_over_given_counts(counts):
+                n_extinctions += 1
+                Xt[:] = stored[self.rng.integers(len(stored))]
+                counts[:] = np.bincount(Xt, minlength=self.number_of_states)
+                n_infected = counts[self.infected]
+            start = t
+            for times, nodes, old_states, new_states in _event_batches(
+                    *self._events(horizon - start, Xt, counts)):
+                # Leaps without transitions
+                if len(nodes) == 0:
+                    continue
+                # The last transition may overshoot the horizon, where
+                # the simulation stops anyway.
+                times = np.minimum(
+                    start + np.broadcast_to(times, len(nodes)),
+                    horizon,
+                    )
+                delta = (new_states == self.infected).astype('int64') \
+                    - (old_states == self.infected)
+                infected = n_infected + np.cumsum(delta)
+                if integrate(np.concatenate(([t], times)),
+                             np.concatenate(([n_infected], infected[:-1])),
+                             ):
+                    break
+                t, n_infected = times[-1], infected[-1]
+
+                # Configurations at the storage times in this batch,
+                # undoing the transitions that happened after them.
+                while next_store <= t:
+                    after = times > next_store
+                    configuration = Xt.copy()
+                    first_nodes, first = np.unique(nodes[after],
+                                                   return_index=True,
+                                                   )
+                    configuration[first_nodes] = old_states[after][first]
+                    if len(stored) < n_stored:
+                        stored.append(configuration)
+                    else:
+                        stored[self.rng.integers(n_stored)] = configuration
+                    next_store += store_every
+
+            if not converged and not self.is_over_given_counts(counts):
+                # Survived up to the horizon
+                integrate(np.array([t, horizon]), np.array([n_infected]))
+                t = horizon
+
+        return {
+            'prevalence': np.mean(batch_means),
+            'half_width': half_width,
+            'batch_means': np.array(batch_means),
+            'n_extinctions': n_extinctions,
+            'time': boundary - batch_time,
+            'converged': converged,
+        }
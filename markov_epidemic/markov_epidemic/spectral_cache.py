@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import contextlib
+import numpy as np
+import scipy.sparse
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (not available on Windows)
+    fcntl = None
+
+
+def graph_fingerprint(A) -> str:
+    """Canonical hash of a sparse adjacency matrix: two graphs with the
+    same nodes order and the same (weighted) edges have the same
+    fingerprint, whatever the internal layout of their CSR storage.
+    """
+    A = scipy.sparse.csr_matrix(A, dtype='float64', copy=True)
+    A.sum_duplicates()
+    A.eliminate_zeros()
+    A.sort_indices()
+    h = hashlib.sha256()
+    h.update(np.asarray(A.shape, dtype='int64').tobytes())
+    h.update(A.indptr.astype('int64').tobytes())
+    h.update(A.indices.astype('int64').tobytes())
+    h.update(A.data.tobytes())
+    return h.hexdigest()
+
+
+class SpectralCache:
+    """Persistent cache of graph spectral invariants, shared between
+    processes and sessions.
+    Each graph gets a .npz file named after its fingerprint in directory,
+    and index.json records the size and last access time of each entry.
+    When the total size exceeds max_bytes, least recently used entries
+    are evicted.
+    Index updates are serialized across processes with a lock file, and
+    .npz files are written to a temporary file and atomically renamed,
+    so readers never see partial entries.
+    """
+    def __init__(self,
+                 directory: str,
+                 max_bytes: int = 512 * 1024 ** 2,
+                 ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, 'index.json')
+
+    def entry_path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, fingerprint + '.npz')
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Exclusive inter-process lock on the cache directory.
+        """
+        with open(os.path.join(self.directory, '.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self, index: dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, fingerprint: str) -> dict:
+        """Returns the cached invariants of a graph as a dict of arrays,
+        or an empty dict if the graph is not in the cache.
+        """
+        invariants = self._load(fingerprint)
+        if not invariants:
+            return invariants
+
+        with self._lock():
+            index = self._read_index()
+            if fingerprint in index:
+                index[fingerprint]['last_access'] = time.time()
+                self._write_index(index)
+        return invariants
+
+    def put(self, fingerprint: str, **invariants) -> None:
+        """Add invariants of a graph to the cache, merged with those
+        already cached for the same graph.
+        """
+        with self._lock():
+            merged = self._load(fingerprint)
+            merged.update(invariants)
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory,
+                                            suffix='.npz.tmp',
+                                            )
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **merged)
+            os.replace(tmp_path, self.entry_path(fingerprint))
+
+            index = self._read_index()
+            index[fingerprint] = {
+                'size': os.path.getsize(self.entry_path(fingerprint)),
+                'last_access': time.time(),
+            }
+            self._evict(index)
+            self._write_index(index)
+
+    def _load(self, fingerprint: str) -> dict:
+        # An entry may be evicted by another process at any time.
+        try:
+            with np.load(self.entry_path(fingerprint)) as npz:
+                return {key: npz[key] for key in npz.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return {}
+
+    def _evict(self, index: dict) -> None:
+        """Remove least recently used entries until the total size
+        fits in max_bytes (the index must be locked).
+        """
+        total_size = sum(entry['size'] for entry in index.values())
+        by_last_access = sorted(index,
+                                key=lambda key: index[key]['last_access'],
+                                )
+        for fingerprint in by_last_access:
+            if total_size <= self.max_bytes or len(index) == 1:
+                break
+            total_size -= index.pop(fingerprint)['size']
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.entry_path(fingerprint))
+
+    def clear(self) -> None:
+        with self._lock():
+            for fingerprint in self._read_index():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.entry_path(fingerprint))
+            self._write_index({})
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class SumTree:
+    """Binary tree whose leaves hold non-negative weights (node transition
+    rates) and whose internal nodes hold the sum of their children.
+    Both drawing a leaf with probability proportional to its weight and
+    updating a weight cost O(log N).
+
+    The tree is stored as a flat list of size 2 * size, where size is the
+    smallest power of 2 larger than the number of leaves: the root is at
+    position 1, the children of position p are at 2p and 2p+1 and leaf i
+    is at position size + i. Updates and draws only touch a handful of
+    entries, for which a list is much faster to index than an array.
+    """
+    def __init__(self, values: np.ndarray) -> None:
+        n = len(values)
+        self.size = 1 << int(np.ceil(np.log2(max(n, 1))))
+        tree = np.zeros(2 * self.size)
+        tree[self.size:self.size+n] = values
+
+        # Fill internal nodes level by level, from the leaves up.
+        lo = self.size // 2
+        while lo >= 1:
+            parents = np.arange(lo, 2 * lo)
+            tree[parents] = tree[2*parents] + tree[2*parents+1]
+            lo //= 2
+
+        self.tree = tree.tolist()
+
+    @property
+    def total(self) -> float:
+        """Sum of all weights.
+        """
+        return self.tree[1]
+
+    def update(self, indices: np.ndarray, values: np.ndarray) -> None:
+        """Set the weights of leaves indices to values and propagate
+        the new sums up to the root.
+        Parent sums are recomputed from their children rather than
+        incremented, so rounding errors do not accumulate over time.
+        """
+        tree = self.tree
+        positions = set()
+        for i, value in zip(np.ravel(indices).tolist(),
+                            np.ravel(values).tolist()):
+            tree[self.size+i] = value
+            positions.add((self.size + i) >> 1)
+
+        while positions and 0 not in positions:
+            parents = set()
+            for position in positions:
+                tree[position] = tree[2*position] + tree[2*position+1]
+                if position > 1:
+                    parents.add(position >> 1)
+            positions = parents
+
+    def find(self, u: float) -> int:
+        """Returns the leaf i such that the sum of the weights of leaves
+        before i is <= u < the same sum including leaf i, for u in
+        [0, total).
+        """
+        tree = self.tree
+        position = 1
+        while position < self.size:
+            left = tree[2*position]
+            # Never walk into an empty subtree, which could otherwise happen
+            # for u very close to the total because of rounding.
+            if u < left or tree[2*position+1] <= 0:
+                position = 2 * position
+            else:
+                u -= left
+                position = 2 * position + 1
+        return position - self.size
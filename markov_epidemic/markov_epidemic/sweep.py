@@ -0,0 +1,225 @@
+import os
+import json
+import itertools
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Prototype epidemics (one per graph, with the graph compiled and its
+# invariants cached) sent once to each worker process by _init_worker.
+_worker_epidemics = None
+
+
+def _init_worker(epidemics: list) -> None:
+    global _worker_epidemics
+    _worker_epidemics = epidemics
+
+
+def _sweep_worker(job: int,
+                  graph_index: int,
+                  parameters: dict,
+                  seed_sequence: np.random.SeedSequence,
+                  T: float,
+                  initial_infected: int,
+                  ) -> tuple:
+    epidemic = _worker_epidemics[graph_index]
+    for name, value in parameters.items():
+        setattr(epidemic, name, value)
+    epidemic.rng = np.random.default_rng(seed_sequence)
+    epidemic.simulate(T, epidemic.random_seed_nodes(initial_infected))
+    row = epidemic.summary()
+    row['effective_diffusion_rate'] = epidemic.effective_diffusion_rate
+    row['inverse_spectral_radius'] = 1 / epidemic.spectral_radius
+    return job, row
+
+
+def _to_table(columns: dict):
+    """Wrap columns in a pandas DataFrame if pandas is installed,
+    otherwise return them as a dict of arrays.
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        return columns
+    return pd.DataFrame(columns)
+
+
+def _rows_to_columns(rows: list) -> dict:
+    """Columns of a list of rows (dicts with the same keys), sorted by job.
+    """
+    if not rows:
+        return {}
+    rows = sorted(rows, key=lambda row: row['job'])
+    return {key: np.array([row[key] for row in rows]) for key in rows[0]}
+
+
+def _write_chunk(out_dir: str, rows: list) -> None:
+    """Atomically write rows as a new columnar chunk.
+    """
+    columns = _rows_to_columns(rows)
+    k = len([name for name in os.listdir(out_dir)
+             if name.startswith('rows_')])
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix='.npz.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, os.path.join(out_dir, 'rows_{:05d}.npz'.format(k)))
+
+
+def _read_chunks(out_dir: str) -> dict:
+    chunks = []
+    for name in sorted(os.listdir(out_dir)):
+        if name.startswith('rows_') and name.endswith('.npz'):
+            with np.load(os.path.join(out_dir, name)) as npz:
+                chunks.append({key: npz[key] for key in npz.files})
+    if not chunks:
+        return {}
+    columns = {
+        key: np.concatenate([chunk[key] for chunk in chunks])
+        for key in chunks[0]
+    }
+    order = np.argsort(columns['job'], kind='stable')
+    return {key: column[order] for key, column in columns.items()}
+
+
+def load_sweep(out_dir: str):
+    """Results of a (possibly interrupted) run_sweep in out_dir, one row
+    per simulation, as a DataFrame if pandas is installed.
+    """
+    return _to_table(_read_chunks(out_dir))
+
+
+def run_sweep(model_cls,
+              graphs: dict,
+              parameters: dict,
+              T: float,
+              n_replicates: int = 1,
+              initial_infected: int = 1,
+              simulation_method: str = 'fastest',
+              seed=None,
+              out_dir: str = None,
+              flush_every: int = 1000,
+              max_workers: int = None,
+              ):
+    """Simulate model_cls (e.g MarkovSIR) on every graph of graphs
+    (a dict name: nx.Graph) for every combination of parameters
+    (a dict rate name: value or list of values, e.g
+    {'infection_rate': np.linspace(0.1, 2, 20), 'recovery_rate': 1.0}),
+    n_replicates times each, across a pool of processes.
+
+    Each graph is compiled and its spectral radius computed once, in the
+    main process, and shipped once to each worker. Every (graph,
+    parameters, replicate) job draws its randomness from its own stream
+    spawned from np.random.SeedSequence(seed), so results do not depend
+    on scheduling.
+
+    Returns one row per job (a DataFrame if pandas is installed, a dict of
+    arrays otherwise) with the graph name, parameters, replicate,
+    final_size, peak, peak_time, lifetime (NaN if still going on at T),
+    extinct, effective_diffusion_rate and inverse_spectral_radius.
+    If out_dir is given, rows are streamed to columnar .npz chunks in that
+    directory every flush_every jobs, and a later call with the same
+    arguments and out_dir resumes the sweep, skipping completed jobs.
+    """
+    graph_names = [str(name) for name in graphs]
+    names = list(parameters)
+    grid = list(itertools.product(
+        *[np.atleast_1d(parameters[name]).tolist() for name in names]
+        ))
+    n_jobs = len(graph_names) * len(grid) * n_replicates
+
+    done = set()
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        meta_path = os.path.join(out_dir, 'meta.json')
+        meta = {
+            'model': model_cls.__name__,
+            'graphs': graph_names,
+            'parameters': {name: [point[k] for point in grid]
+                           for k, name in enumerate(names)},
+            'T': T,
+            'n_replicates': n_replicates,
+            'initial_infected': initial_infected,
+            'simulation_method': simulation_method,
+        }
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                previous_meta = json.load(f)
+            entropy = previous_meta.pop('entropy')
+            if previous_meta != meta:
+                raise ValueError('{} holds a different sweep.'.format(out_dir))
+        else:
+            entropy = np.random.SeedSequence(seed).entropy
+            with open(meta_path, 'w') as f:
+                json.dump(dict(meta, entropy=entropy), f)
+        done = set(_read_chunks(out_dir).get('job', np.empty(0)).tolist())
+    else:
+        entropy = np.random.SeedSequence(seed).entropy
+
+    # Compile each graph and its invariants once.
+    epidemics = []
+    for G in graphs.values():
+        epidemic = model_cls(G=G,
+                             simulation_method=simulation_method,
+                             **dict(zip(names, grid[0])),
+                             )
+        epidemic.spectral_radius
+        epidemics.append(epidemic)
+
+    def jobs():
+        for job in range(n_jobs):
+            if job in done:
+                continue
+            graph_index, rest = divmod(job, len(grid) * n_replicates)
+            point = grid[rest // n_replicates]
+            yield job, graph_index, dict(zip(names, point))
+
+    rows = []
+
+    def record(future) -> None:
+        job, summary = future.result()
+        graph_index, rest = divmod(job, len(grid) * n_replicates)
+        point, replicate = divmod(rest, n_replicates)
+        row = {'job': job, 'graph': graph_names[graph_index]}
+        row.update(zip(names, grid[point]))
+        row['replicate'] = replicate
+        row.update(summary)
+        rows.append(row)
+        if out_dir is not None and len(rows) >= flush_every:
+            _write_chunk(out_dir, rows)
+            rows.clear()
+
+    pending = set()
+    max_pending = 4 * (max_workers or os.cpu_count() or 1)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 initializer=_init_worker,
+                                 initargs=(epidemics,),
+                                 ) as executor:
+            for job, graph_index, point in jobs():
+                # Bound the number of queued jobs, for large sweeps.
+                if len(pending) >= max_pending:
+                    finished, pending = wait(pending,
+                                             return_when=FIRST_COMPLETED,
+                                             )
+                    for future in finished:
+                        record(future)
+                pending.add(executor.submit(
+                    _sweep_worker,
+                    job,
+                    graph_index,
+                    point,
+                    np.random.SeedSequence(entropy, spawn_key=(job,)),
+                    T,
+                    initial_infected,
+                    ))
+            for future in wait(pending).done:
+                record(future)
+    finally:
+        # Keep completed jobs on interruption, to resume from there.
+        if out_dir is not None and rows:
+            _write_chunk(out_dir, rows)
+
+    if out_dir is not None:
+        return load_sweep(out_dir)
+    return _to_table(_rows_to_columns(rows))
@@ -0,0 +1,189 @@
+import numpy as np
+import networkx as nx
+from scipy.stats import norm
+
+
+def _wilson_interval(successes: int, n: int, z: float) -> tuple:
+    """Wilson score confidence interval of a binomial proportion.
+    """
+    p = successes / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z * np.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) \
+        / denominator
+    return center - half_width, center + half_width
+
+
+def _is_outbreak(epidemic,
+                 T: float,
+                 cutoff: float,
+                 initial_infected: int,
+                 outbreak_size: int,
+                 monotone: bool,
+                 ) -> bool:
+    """Simulate a single run and decide whether it is a major outbreak,
+    i.e whether at least outbreak_size nodes are not susceptible at time T.
+    The run is stopped as soon as the outcome is known: on extinction,
+    once outbreak_size nodes are reached past time cutoff (survival),
+    or right away if nodes never return to the susceptible state
+    (e.g SIR).
+    """
+    x0 = epidemic.random_seed_nodes(initial_infected)
+    counts = None
+    for t, counts in epidemic.iter_events(T, x0, snapshots=True):
+        affected = epidemic.N - counts[epidemic.susceptible]
+        if affected >= outbreak_size and (monotone or t >= cutoff):
+            return True
+    if not monotone and epidemic.is_over_given_counts(counts):
+        return False
+    return epidemic.N - counts[epidemic.susceptible] >= outbreak_size
+
+
+def estimate_threshold(model_cls,
+                       G: nx.Graph,
+                       rate: str = 'infection_rate',
+                       parameters: dict = None,
+                       lower: float = None,
+                       upper: float = None,
+                       T: float = 50.0,
+                       cutoff: float = None,
+                       initial_infected: int = None,
+                       outbreak_fraction: float = 0.2,
+                       target: float = 0.5,
+                       rtol: float = 0.02,
+                       batch_size: int = 8,
+                       max_runs_per_probe: int = 128,
+                       confidence: float = 0.95,
+                       simulation_method: str = 'fastest',
+                       seed=None,
+                       ) -> dict:
+    """Estimate the empirical epidemic threshold of model_cls on G: the
+    value of rate (the contact rate, i.e 'exposition_rate' for
+    MarkovSEIR), the other rates being fixed to parameters (by default
+    {'recovery_rate': 1.0}), at which the probability of a major outbreak
+    crosses target.
+
+    A run is a major outbreak if at least outbreak_fraction of the nodes
+    are not susceptible at time T, starting from initial_infected random
+    nodes (by default 5% of the nodes). Runs are stopped as soon as
+    the outcome is known: on extinction, or once the outbreak size is
+    reached, past time cutoff (by default T/5) for models where nodes
+    return to the susceptible state (SIS), right away otherwise.
+
+    The threshold is bracketed by [lower, upper] (by default, 1/10 and
+    10 times the rate at which effective_diffusion_rate equals
+    1/spectral_radius), which is checked first by probing both ends
+    (a ValueError is raised if the outbreak probability is on the same
+    side of target at both), and located by geometric bisection down to a
+    relative width rtol. Each probe runs batches of batch_size replicates
+    until the confidence interval of the outbreak probability excludes
+    target, so replicates are spent near the threshold, where the
+    outcome is uncertain. If max_runs_per_probe replicates do not
+    suffice, the probe is statistically indistinguishable from the
+    threshold and the bisection stops there.
+
+    Returns a dict with the threshold rate, the corresponding
+    effective_diffusion_rate, the final bracket, the
+    inverse_spectral_radius for comparison, the probes
+    (rate, number of runs, number of outbreaks) and the total number
+    of runs.
+    """
+    if parameters is None:
+        parameters = {'recovery_rate': 1.0}
+    epidemic = model_cls(G=G,
+                         simulation_method=simulation_method,
+                         rng=seed,
+                         **dict(parameters, **{rate: 1.0}),
+                         )
+    if initial_infected is None:
+        initial_infected = max(1, epidemic.N // 20)
+    outbreak_size = outbreak_fraction * epidemic.N
+    if cutoff is None:
+        cutoff = T / 5
+
+    # Nodes never return to the susceptible state, so that the number of
+    # non-susceptible nodes never decreases.
+    table = epidemic.next_state_table
+    monotone = not any(
+        table[state] == epidemic.susceptible
+        for state in range(epidemic.number_of_states)
+        if state != epidemic.susceptible
+        )
+
+    # effective_diffusion_rate is proportional to the contact rate.
+    mean_field_rate = 1 / (epidemic.spectral_radius
+                           * epidemic.effective_diffusion_rate)
+    if lower is None:
+        lower = mean_field_rate / 10
+    if upper is None:
+        upper = mean_field_rate * 10
+    if not 0 < lower < upper:
+        raise ValueError('Expected 0 < lower < upper.')
+
+    z = norm.ppf(0.5 + confidence / 2)
+    probes = []
+
+    def probe(value: float) -> str:
+        """Run replicates at rate value until the outbreak probability is
+        known to be 'above' or 'below' target, or None if it is still
+        undecided after max_runs_per_probe replicates.
+        """
+        setattr(epidemic, rate, value)
+        n_runs = 0
+        n_outbreaks = 0
+        decision = None
+        while decision is None and n_runs < max_runs_per_probe:
+            for _ in range(batch_size):
+                n_outbreaks += _is_outbreak(epidemic,
+                                            T,
+                                            cutoff,
+                                            initial_infected,
+                                            outbreak_size,
+                                            monotone,
+                                            )
+            n_runs += batch_size
+            low, high = _wilson_interval(n_outbreaks, n_runs, z)
+            if low > target:
+                decision = 'above'
+            elif high < target:
+                decision = 'below'
+        probes.append((value, n_runs, n_outbreaks))
+        return decision
+
+    # Check the bracket first, otherwise the bisection would quietly
+    # converge to one of its ends.
+    threshold = None
+    for end, wrong_side in [(lower, 'above'), (upper, 'below')]:
+        decision = probe(end)
+        if decision is None:
+            threshold = end
+            break
+        if decision == wrong_side:
+            raise ValueError(
+                'The threshold is not bracketed by [{}, {}]: the outbreak '
+                'probability is {} target at {}.'.format(lower, upper,
+                                                         wrong_side, end)
+                )
+
+    while threshold is None and upper / lower - 1 > rtol:
+        middle = np.sqrt(lower * upper)
+        decision = probe(middle)
+        if decision == 'above':
+            upper = middle
+        elif decision == 'below':
+            lower = middle
+        else:
+            threshold = middle
+
+    if threshold is None:
+        threshold = np.sqrt(lower * upper)
+    setattr(epidemic, rate, threshold)
+    return {
+        'threshold': threshold,
+        'effective_diffusion_rate': epidemic.effective_diffusion_rate,
+        'lower': lower,
+        'upper': upper,
+        'inverse_spectral_radius': 1 / epidemic.spectral_radius,
+        'probes': probes,
+        'n_runs': sum(n_runs for _, n_runs, _ in probes),
+    }
@@ -0,0 +1,363 @@
+import numpy as np
+
+
+def counts_after_transitions(counts: np.ndarray,
+                             old_states: np.ndarray,
+                             new_states: np.ndarray,
+                             ) -> np.ndarray:
+    """Compartment counts after each of a sequence of transitions, starting
+    from counts (counts[s] is the number of nodes in state s): row k is
+    the counts after the k-th transition.
+    """
+    n = len(new_states)
+    increments = np.zeros((n, len(counts)), dtype='int32')
+    np.add.at(increments, (np.arange(n), np.asarray(new_states)), 1)
+    np.add.at(increments, (np.arange(n), np.asarray(old_states)), -1)
+    return counts + np.cumsum(increments, axis=0)
+
+
+def previous_states(x0: np.ndarray,
+                    nodes: np.ndarray,
+                    new_states: np.ndarray,
+                    ) -> np.ndarray:
+    """State of the transitioned node just before each transition, i.e
+    the previous new state of the same node, or its initial state in x0
+    for its first transition.
+    """
+    nodes = np.asarray(nodes)
+    new_states = np.asarray(new_states)
+    old_states = np.empty_like(new_states)
+
+    # Group transitions by node, keeping them in chronological order.
+    order = np.argsort(nodes, kind='stable')
+    sorted_nodes = nodes[order]
+    first = np.ones(len(order), dtype='bool')
+    first[1:] = sorted_nodes[1:] != sorted_nodes[:-1]
+
+    previous = np.empty_like(new_states)
+    previous[1:] = new_states[order[:-1]]
+    previous[first] = np.asarray(x0)[sorted_nodes[first]]
+    old_states[order] = previous
+    return old_states
+
+
+def build_dense(x0: np.ndarray,
+                nodes: np.ndarray,
+                new_states: np.ndarray,
+                packed: bool = False,
+                ) -> np.ndarray:
+    """Build the full trajectory matrix from the initial state vector and
+    the sequence of transitions: row k is the state vector after the k-th
+    transition.
+    For two-state models, packed=True builds the rows directly
+    bit-packed (as np.packbits would), using N/8 bytes per row.
+    """
+    x0 = np.asarray(x0)
+    nodes = np.asarray(nodes)
+    new_states = np.asarray(new_states)
+    N = len(x0)
+    if not packed:
+        X = np.empty((len(nodes) + 1, N), dtype=x0.dtype)
+        X[0] = x0
+        for k, (node, state) in enumerate(zip(nodes, new_states)):
+            X[k+1] = X[k]
+            X[k+1, node] = state
+        return X
+
+    if np.any(x0 > 1) or np.any(new_states > 1):
+        raise ValueError('Bit-packing requires a two-state model.')
+    X = np.empty((len(nodes) + 1, (N + 7) // 8), dtype='uint8')
+    X[0] = np.packbits(x0)
+    for k, (node, state) in enumerate(zip(nodes.tolist(),
+                                          new_states.tolist())):
+        X[k+1] = X[k]
+        # np.packbits is big-endian within each byte.
+        mask = 1 << (7 - (node & 7))
+        if state:
+            X[k+1, node >> 3] |= mask
+        else:
+            X[k+1, node >> 3] &= ~mask & 0xFF
+    return X
+
+
+class EventLog:
+    """Compact record of a simulated Markov epidemic: the initial state
+    vector and, for each transition, its time, the index of the node that
+    transitioned and its new state.
+    Memory is O(N + number of transitions) instead of the
+    O(N x number of transitions) of the full trajectory matrix.
+
+    The number of nodes in each compartment is maintained in O(1) per
+    transition and recorded alongside the transition times.
+    """
+    def __init__(self,
+                 x0: np.ndarray,
+                 n_states: int,
+                 capacity: int = 1024,
+                 ) -> None:
+        self.x0 = np.array(x0)
+        self.current_counts = np.bincount(
+            self.x0.astype('int64'),
+            minlength=n_states,
+            ).astype('int32')
+        self._size = 0
+        self._times = np.empty(capacity, dtype='float')
+        self._nodes = np.empty(capacity, dtype='int64')
+        self._states = np.empty(capacity, dtype=self.x0.dtype)
+        self._counts = np.empty((capacity + 1, n_states), dtype='int32')
+        self._counts[0] = self.current_counts
+
+    def __len__(self) -> int:
+        """Number of recorded transitions.
+        """
+        return self._size
+
+    @property
+    def N(self) -> int:
+        return len(self.x0)
+
+    def _grow(self) -> None:
+        """Double the capacity of the buffers.
+        """
+        capacity = 2 * max(len(self._times), 1)
+        self._times = np.resize(self._times, capacity)
+        self._nodes = np.resize(self._nodes, capacity)
+        self._states = np.resize(self._states, capacity)
+        counts = np.empty((capacity + 1, self._counts.shape[1]),
+                          dtype=self._counts.dtype,
+                          )
+        counts[:self._size+1] = self._counts[:self._size+1]
+        self._counts = counts
+
+    def append(self,
+               t: float,
+               node: int,
+               old_state: int,
+               new_state: int,
+               ) -> None:
+        if self._size == len(self._times):
+            self._grow()
+        self._times[self._size] = t
+        self._nodes[self._size] = node
+        self._states[self._size] = new_state
+        self.current_counts[old_state] -= 1
+        self.current_counts[new_state] += 1
+        self._size += 1
+        self._counts[self._size] = self.current_counts
+
+    def extend(self,
+               t,
+               nodes: np.ndarray,
+               old_states: np.ndarray,
+               new_states: np.ndarray,
+               ) -> None:
+        """Record several transitions at once, in that order. t is either
+        the array of their times, or a single time if they all happen at
+        the same time (as produced by approximate simulation methods).
+        """
+        n = len(nodes)
+        while self._size + n > len(self._times):
+            self._grow()
+
+        # Compartment counts after each of the transitions
+        counts = counts_after_transitions(self.current_counts,
+                                          old_states,
+                                          new_states,
+                                          )
+
+        start, end = self._size, self._size + n
+        self._times[start:end] = t
+        self._nodes[start:end] = nodes
+        self._states[start:end] = new_states
+        self._counts[start+1:end+1] = counts
+        if n > 0:
+            self.current_counts = counts[-1].copy()
+        self._size = end
+
+    @property
+    def times(self) -> np.ndarray:
+        return self._times[:self._size]
+
+    @property
+    def nodes(self) -> np.ndarray:
+        return self._nodes[:self._size]
+
+    @property
+    def new_states(self) -> np.ndarray:
+        return self._states[:self._size]
+
+    @property
+    def transition_times(self) -> np.ndarray:
+        """Transition times, starting with the initial time 0.
+        """
+        return np.concatenate([[0.0], self.times])
+
+    @property
+    def old_states(self) -> np.ndarray:
+        """State of the transitioned node just before each transition,
+        i.e the previous new state of the same node, or its initial state
+        for its first transition.
+        """
+        return previous_states(self.x0, self.nodes, self.new_states)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Compartment counts at each transition time, counts[k, s] is the
+        number of nodes in state s after the k-th transition.
+        """
+        return self._counts[:self._size+1]
+
+    def count(self, state: int) -> np.ndarray:
+        """Number of nodes in a given state at each transition time.
+        """
+        return self.counts[:, state]
+
+    def to_dense(self, packed: bool = False) -> np.ndarray:
+        """Build the full trajectory matrix, whose row k is the state
+        vector after the k-th transition (see build_dense).
+        """
+        return build_dense(self.x0, self.nodes, self.new_states, packed)
+
+
+class GridRecorder:
+    """Record of a simulated Markov epidemic on a fixed grid of times:
+    only the compartment counts (and optionally the full state vector)
+    at the grid times are stored, so memory scales with the size of the
+    grid instead of the number of transitions.
+    The value at a grid time includes the transitions happening exactly
+    at that time. Grid times after the end of the simulation carry the
+    final state.
+    """
+    def __init__(self,
+                 x0: np.ndarray,
+                 n_states: int,
+                 record_times: np.ndarray,
+                 record_states: bool = False,
+                 ) -> None:
+        self.x0 = np.array(x0)
+        self.record_times = np.sort(np.asarray(record_times, dtype='float'))
+        self.record_states = record_states
+        self.current_counts = np.bincount(
+            self.x0.astype('int64'),
+            minlength=n_states,
+            ).astype('int32')
+        self.n_transitions = 0
+
+        self._next = 0
+        self._counts = np.empty((len(self.record_times), n_states),
+                                dtype='int32',
+                                )
+        if record_states:
+            self._x = self.x0.copy()
+            self._states = np.empty((len(self.record_times), len(self.x0)),
+                                    dtype=self.x0.dtype,
+                                    )
+
+    def __len__(self) -> int:
+        """Number of transitions seen.
+        """
+        return self.n_transitions
+
+    def _record_until(self, t: float) -> None:
+        """Record the current state at all pending grid times before t.
+        """
+        end = np.searchsorted(self.record_times, t, side='left')
+        if end > self._next:
+            self._counts[self._next:end] = self.current_counts
+            if self.record_states:
+                self._states[self._next:end] = self._x
+            self._next = end
+
+    def append(self,
+               t: float,
+               node: int,
+               old_state: int,
+               new_state: int,
+               ) -> None:
+        self._record_until(t)
+        self.current_counts[old_state] -= 1
+        self.current_counts[new_state] += 1
+        if self.record_states:
+            self._x[node] = new_state
+        self.n_transitions += 1
+
+    def extend(self,
+               t,
+               nodes: np.ndarray,
+               old_states: np.ndarray,
+               new_states: np.ndarray,
+               ) -> None:
+        """Same as EventLog.extend.
+        """
+        n = len(nodes)
+        if n == 0:
+            return
+        times = np.broadcast_to(t, n)
+        if self.record_states:
+            for event in zip(times, nodes, old_states, new_states):
+                self.append(*event)
+            return
+
+        # Compartment counts after each of the transitions
+        counts = np.concatenate(
+            [self.current_counts[np.newaxis],
+             counts_after_transitions(self.current_counts,
+                                      old_states,
+                                      new_states,
+                                      )]
+            )
+
+        # Pending grid times before the last transition of the batch, and
+        # the number of transitions of the batch that happened by then.
+        end = np.searchsorted(self.record_times, times[-1], side='left')
+        if end > self._next:
+            seen = np.searchsorted(times,
+                                   self.record_times[self._next:end],
+                                   side='right',
+                                   )
+            self._counts[self._next:end] = counts[seen]
+            self._next = end
+        self.current_counts = counts[-1].copy()
+        self.n_transitions += n
+
+    @property
+    def transition_times(self) -> np.ndarray:
+        """Grid times (named after EventLog.transition_times so that both
+        records can be used interchangeably).
+        """
+        return self.record_times
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Compartment counts at each grid time, counts[k, s] is the number
+        of nodes in state s at the k-th grid time.
+        """
+        counts = self._counts.copy()
+        counts[self._next:] = self.current_counts
+        return counts
+
+    def count(self, state: int) -> np.ndarray:
+        """Number of nodes in a given state at each grid time.
+        """
+        return self.counts[:, state]
+
+    @property
+    def nodes(self) -> np.ndarray:
+        raise ValueError('Transitions are not recorded on a fixed grid.')
+
+    def to_dense(self, packed: bool = False) -> np.ndarray:
+        """State vectors at each grid time (if record_states).
+        For two-state models, packed=True returns the rows bit-packed
+        with np.packbits.
+        """
+        if not self.record_states:
+            raise ValueError('State vectors were not recorded, '
+                             'use record_states=True.'
+                             )
+        states = self._states.copy()
+        states[self._next:] = self._x
+        if not packed:
+            return states
+        if np.any(states > 1):
+            raise ValueError('Bit-packing requires a two-state model.')
+        return np.packbits(states, axis=1)
@@ -152,3 +152,26 @@ def profile_simulation(n_sim: int = 10) -> None:
         'Fastest simulation: {:.0f}ms +/. {:.0f}ms'.format(fastest_times_mean,
                                                            fastest_times_std)
         )
+
+
+def check_rate_engine(n_transitions: int = 100, seed: int = 0) -> None:
+    """Elementary consistency check of the rates maintained incrementally
+    by RateEngine against transition_rates, on a directed weighted graph.
+    """
+    import networkx as nx
+    from .rate_engine import RateEngine
+    from .sir_epidemic import MarkovSIR
+
+    rng = np.random.default_rng(seed)
+    G = nx.gnp_random_graph(50, 0.1, seed=seed, directed=True)
+    for u, v in G.edges:
+        G.edges[u, v]['weight'] = rng.uniform(0.5, 2.0)
+
+    SIR = MarkovSIR(1.0, 1.0, G, rng=seed)
+    Xt = SIR.random_seed_nodes(5)
+    engine = RateEngine(SIR, Xt)
+    for _ in range(n_transitions):
+        i = rng.integers(SIR.N)
+        engine.transition(i, SIR.next_state_table[Xt[i]])
+        assert np.allclose(engine.rates, SIR.transition_rates(Xt)), \
+            'Rates of RateEngine differ from transition_rates.'